@@ -0,0 +1,10 @@
+import multiprocessing
+import sys
+from stuff.benchmark import main
+
+
+if __name__ == '__main__':
+    # Required for the process pool in the packaged executable.
+    multiprocessing.freeze_support()
+
+    sys.exit(main())
@@ -1,11 +1,74 @@
+# Measures the startup from here on, so it includes the imports. The wall clock gets its own name, as the module
+#  and the function named time are both imported below.
+from time import perf_counter, time as wall_time
+STARTUP_START_TIME = perf_counter()
+
+import json
 import logging
+import multiprocessing
+import os
 import sys
+import threading
 import time
+from collections import deque
 from pathlib import Path
 from PySide6 import QtCore, QtWidgets, QtGui
-from stuff import Converter, ConverterUpdateEvent, ConverterLogEvent
+from stuff import Converter, ConverterUpdateEvent, OcrMode, warm_up
+from stuff.converter import SearchableThread
+from stuff.options import parse_stage_thread_counts
+from stuff.archive import ArchiveIndex, ARCHIVE_INDEX_FILE_NAME
 from time import time
 
+# The number of seconds the imports took, the PDF and OCR libraries aren't imported until the window is shown.
+STARTUP_IMPORT_SECONDS = perf_counter() - STARTUP_START_TIME
+
+# The maximum number of lines shown in the log of the status window, the full log is in the log file.
+LOG_VIEW_MAX_ROWS = 5000
+
+# The interval in milliseconds at which the status window takes the events of the converter.
+EVENT_FLUSH_INTERVAL = 100
+
+
+class LogListModel(QtCore.QAbstractListModel):
+    '''
+    List model over a ring buffer of log lines, once full the oldest lines
+    are removed as new ones are added.
+    '''
+
+    def __init__(self, max_rows: int = LOG_VIEW_MAX_ROWS) -> None:
+        super().__init__()
+        self.max_rows = max_rows
+        self.lines: deque[str] = deque(maxlen=max_rows)
+
+    def rowCount(self, parent: QtCore.QModelIndex | QtCore.QPersistentModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.lines)
+
+    def data(self, index: QtCore.QModelIndex | QtCore.QPersistentModelIndex,
+             role: int = QtCore.Qt.ItemDataRole.DisplayRole):
+        if role != QtCore.Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+
+        return self.lines[index.row()]
+
+    def append_lines(self, lines: list[str]) -> None:
+        # Only the last lines fit, if there are more than that.
+        lines = lines[-self.max_rows:]
+        if len(lines) == 0:
+            return
+
+        # Removes the oldest lines to make room for the new ones.
+        removed_count = max(0, len(self.lines) + len(lines) - self.max_rows)
+        if removed_count != 0:
+            self.beginRemoveRows(QtCore.QModelIndex(), 0, removed_count - 1)
+            for _ in range(removed_count):
+                self.lines.popleft()
+            self.endRemoveRows()
+
+        # Adds the new lines at once.
+        self.beginInsertRows(QtCore.QModelIndex(), len(self.lines), len(self.lines) + len(lines) - 1)
+        self.lines.extend(lines)
+        self.endInsertRows()
+
 
 class MyStatusWindow(QtWidgets.QDialog):
     def __init__(self, converter: Converter) -> None:
@@ -13,8 +76,7 @@ class MyStatusWindow(QtWidgets.QDialog):
 
         # Creates the converter.
         self.converter = converter
-        self.converter.status_signal.connect(self.on_status)
-        self.converter.log_signal.connect(self.on_log)
+        self.converter.finished.connect(self.on_event_timer_timeout)
         self.converter.start()
 
         # Sets the window title.
@@ -35,15 +97,23 @@ class MyStatusWindow(QtWidgets.QDialog):
         self.elapsed_time_label.setText('Verlopen tijd: -')
         self.grid.addWidget(self.elapsed_time_label, 2, 0)
 
+        # Creates the label with the rate and the remaining time.
+        self.rate_label = QtWidgets.QLabel()
+        self.rate_label.setText('Snelheid: -')
+        self.grid.addWidget(self.rate_label, 3, 0)
+
         # Creates the button box.
         self.button_box = QtWidgets.QDialogButtonBox(
             QtWidgets.QDialogButtonBox.StandardButton.Ok)
         self.button_box.accepted.connect(self.accept)
         self.button_box.setDisabled(True)
-        self.grid.addWidget(self.button_box, 3, 0)
+        self.grid.addWidget(self.button_box, 4, 0)
 
-        # Creates the list widget for the log.
-        self.log_list = QtWidgets.QListWidget()
+        # Creates the list view for the log, with all rows the same height so it never measures them all.
+        self.log_model = LogListModel()
+        self.log_list = QtWidgets.QListView()
+        self.log_list.setUniformItemSizes(True)
+        self.log_list.setModel(self.log_model)
         self.grid.addWidget(self.log_list, 1, 0)
 
         # Sets the layout.
@@ -55,21 +125,40 @@ class MyStatusWindow(QtWidgets.QDialog):
         self.timer.setInterval(50)
         self.timer.start()
 
+        # Creates the timer that takes the events of the converter.
+        self.event_timer = QtCore.QTimer(self)
+        self.event_timer.timeout.connect(self.on_event_timer_timeout)
+        self.event_timer.setInterval(EVENT_FLUSH_INTERVAL)
+        self.event_timer.start()
+
         # Sets the start time.
         self.start_time = time()
 
+    @QtCore.Slot()
+    def on_event_timer_timeout(self) -> None:
+        status, logs, dropped_log_count = self.converter.take_events()
+
+        # Adds the messages to the log and scrolls to the bottom, once for all of them.
+        lines = [str(log) for log in logs]
+        if dropped_log_count != 0:
+            lines.insert(0, f'... {dropped_log_count} regels overgeslagen, zie het logbestand')
+        if len(lines) != 0:
+            self.log_model.append_lines(lines)
+            self.log_list.scrollToBottom()
+
+        if status is not None:
+            self.on_status(status)
+
+        # Stops taking events once the converter is done and all its events are taken.
+        if self.converter.isFinished() and status is None and len(logs) == 0:
+            self.event_timer.stop()
+
     @QtCore.Slot()
     def on_timer_timeout(self):
         current_time = time()
         elapsed_time = int(round((current_time - self.start_time) * 100.0) * 10.0)
         self.elapsed_time_label.setText(f'Verlopen tijd: {elapsed_time}ms')
 
-    @QtCore.Slot()
-    def on_log(self, log: ConverterLogEvent) -> None:
-        # Adds the message to the log and scrolls to the bottom.
-        self.log_list.addItem(str(log))
-        self.log_list.scrollToBottom()
-
     @QtCore.Slot()
     def on_status(self, status: ConverterUpdateEvent) -> None:
         # Enables the buttons if finished.
@@ -83,6 +172,17 @@ class MyStatusWindow(QtWidgets.QDialog):
         self.progress_bar.setFormat(status.message if len(status.message) < 60 else f'{status.message[:60]}...')
         self.progress_bar.setValue(status.progress)
 
+        # Updates the rate and the remaining time, once enough pages are done to tell. Once finished only the
+        #  rate is left, nothing remains.
+        if status.pages_per_second is not None and status.progress == 100:
+            self.rate_label.setText(f'Snelheid: {status.pages_per_second:.2f} pagina\'s/s')
+        elif status.pages_per_second is not None and status.eta_seconds is not None:
+            (eta_minutes, eta_seconds) = divmod(int(round(status.eta_seconds)), 60)
+            self.rate_label.setText(f'Snelheid: {status.pages_per_second:.2f} pagina\'s/s, '
+                                    f'nog ongeveer {eta_minutes}:{eta_seconds:02d}')
+        elif status.progress == 100:
+            self.rate_label.setText('Snelheid: -')
+
 
 class MyWindowWidget(QtWidgets.QWidget):
     def __init__(self, settings: QtCore.QSettings) -> None:
@@ -99,6 +199,57 @@ class MyWindowWidget(QtWidgets.QWidget):
         self.finished_dir_path = Path(str(self.settings.value('folders/finished', str(self.default_drawings_path / 'Verwerkt'))))
         self.temp_dir_path = Path(str(self.settings.value('folders/temp', str(self.default_drawings_path / 'Temp'))))
 
+        # Gets the number of processes used to process the files.
+
+        self.worker_count = int(str(self.settings.value('processing/workers', 1)))
+
+        # Gets the OCR mode, the title block mode is faster but doesn't make the archived pages searchable.
+
+        self.ocr_mode = OcrMode(str(self.settings.value('processing/ocr_mode', OcrMode.FULL.value)))
+
+        # Gets whether the title is looked for in the embedded text of the PDF files before performing OCR.
+
+        self.use_text_layer = str(self.settings.value('processing/use_text_layer', 'true')).lower() == 'true'
+
+        # Gets the path of the cache with the results of earlier processed pages.
+
+        self.default_cache_path = Path(QtCore.QStandardPaths.writableLocation(
+            QtCore.QStandardPaths.StandardLocation.AppDataLocation)) / 'cache.sqlite3'
+        self.cache_path = Path(str(self.settings.value('cache/path', str(self.default_cache_path))))
+
+        # Gets the path of the log file, which is rotated once it grows too large.
+
+        self.log_path = Path(str(self.settings.value('log/path', str(self.default_cache_path.parent / 'logs' /
+                                                                   'converter.log'))))
+
+        # Gets the path of the file the timing reports of the runs are appended to.
+
+        self.report_path = Path(str(self.settings.value('log/report_path', str(self.default_cache_path.parent /
+                                                                              'reports.jsonl'))))
+
+        # Gets the path of the file the startup times are appended to.
+
+        self.startup_report_path = Path(str(self.settings.value('log/startup_report_path', str(
+            self.default_cache_path.parent / 'startup.jsonl'))))
+
+        # Gets the maximum size of the temp directory in megabytes, zero means unlimited.
+
+        self.temp_max_mb = int(str(self.settings.value('processing/temp_max_mb', 0)))
+
+        # Gets the number of threads per stage of the page pipeline, like 'rasterize=2,orientation=4'.
+
+        try:
+            self.stage_thread_counts = parse_stage_thread_counts(str(self.settings.value('processing/stage_threads',
+                                                                                         '')))
+        except ValueError as e:
+            logging.warning(f'Ignoring the stage thread counts setting: {e}')
+            self.stage_thread_counts = {}
+
+        # Gets the path of the title detection profiles, a JSON file next to the cache by default.
+
+        self.profiles_path = Path(str(self.settings.value('processing/profiles',
+                                                          str(self.default_cache_path.parent / 'profiles.json'))))
+
         # Ensures the paths where the files will be located exist.
 
         self.in_dir_path.mkdir(parents=True, exist_ok=True)
@@ -107,6 +258,12 @@ class MyWindowWidget(QtWidgets.QWidget):
         self.finished_dir_path.mkdir(parents=True, exist_ok=True)
         self.temp_dir_path.mkdir(parents=True, exist_ok=True)
 
+        # Makes the pages archived in the deferred mode searchable whenever there's nothing else to do, it's
+        #  started once the window is shown.
+
+        self.searchable_thread = SearchableThread(self.temp_dir_path)
+        self.first_painted = False
+
         # Creates the grid.
 
         self.grid = QtWidgets.QGridLayout(self)
@@ -196,11 +353,92 @@ class MyWindowWidget(QtWidgets.QWidget):
         self.clear_finished_dir_btn.clicked.connect(self.on_clear_finished_folder_btn_clicked)
         self.dirs_layout.addWidget(self.clear_finished_dir_btn, 3, 2)
 
+        # Worker count
+
+        self.worker_count_label = QtWidgets.QLabel()
+        self.worker_count_label.setText('Aantal processen')
+        self.dirs_layout.addWidget(self.worker_count_label, 4, 0)
+
+        self.worker_count_spin_box = QtWidgets.QSpinBox()
+        self.worker_count_spin_box.setMinimum(1)
+        self.worker_count_spin_box.setMaximum(os.cpu_count() or 1)
+        self.worker_count_spin_box.setValue(self.worker_count)
+        self.worker_count_spin_box.valueChanged.connect(self.on_worker_count_spin_box_value_changed)
+        self.dirs_layout.addWidget(self.worker_count_spin_box, 4, 1)
+
+        # OCR mode
+
+        self.ocr_mode_label = QtWidgets.QLabel()
+        self.ocr_mode_label.setText('OCR modus')
+        self.dirs_layout.addWidget(self.ocr_mode_label, 5, 0)
+
+        self.ocr_mode_combo_box = QtWidgets.QComboBox()
+        self.ocr_mode_combo_box.addItem('Volledige pagina (doorzoekbaar)', OcrMode.FULL.value)
+        self.ocr_mode_combo_box.addItem('Volledige pagina (niet doorzoekbaar)', OcrMode.SINGLE_PASS.value)
+        self.ocr_mode_combo_box.addItem('Alleen titelblok (snel)', OcrMode.TITLE_BLOCK.value)
+        self.ocr_mode_combo_box.addItem('Alleen titelblok, later doorzoekbaar', OcrMode.DEFERRED.value)
+        self.ocr_mode_combo_box.setCurrentIndex(self.ocr_mode_combo_box.findData(self.ocr_mode.value))
+        self.ocr_mode_combo_box.currentIndexChanged.connect(self.on_ocr_mode_combo_box_index_changed)
+        self.dirs_layout.addWidget(self.ocr_mode_combo_box, 5, 1)
+
+        # Text layer
+
+        self.use_text_layer_check_box = QtWidgets.QCheckBox('Gebruik tekst uit PDF indien aanwezig')
+        self.use_text_layer_check_box.setChecked(self.use_text_layer)
+        self.use_text_layer_check_box.toggled.connect(self.on_use_text_layer_check_box_toggled)
+        self.dirs_layout.addWidget(self.use_text_layer_check_box, 6, 1)
+
+        # Archive search
+
+        self.search_group_box = QtWidgets.QGroupBox()
+        self.search_group_box.setTitle('Zoek tekening')
+
+        self.search_layout = QtWidgets.QVBoxLayout()
+        self.search_group_box.setLayout(self.search_layout)
+        self.grid.addWidget(self.search_group_box, 2, 0)
+
+        self.search_ln_edit = QtWidgets.QLineEdit()
+        self.search_ln_edit.setPlaceholderText('Project- en tekeningnummer, bijv. 1234.56')
+        self.search_ln_edit.textChanged.connect(self.on_search_ln_edit_text_changed)
+        self.search_layout.addWidget(self.search_ln_edit)
+
+        self.search_results_list = QtWidgets.QListWidget()
+        self.search_results_list.itemActivated.connect(self.on_search_results_list_item_activated)
+        self.search_layout.addWidget(self.search_results_list)
+
         # Process button
 
         self.process_btn = QtWidgets.QPushButton('Verwerk')
         self.process_btn.clicked.connect(self.on_process_btn_clicked)
-        self.grid.addWidget(self.process_btn, 2, 0)
+        self.grid.addWidget(self.process_btn, 3, 0)
+
+    def paintEvent(self, event: QtGui.QPaintEvent) -> None:
+        super().paintEvent(event)
+
+        # Finishes the startup once the window is on the screen.
+        if not self.first_painted:
+            self.first_painted = True
+            QtCore.QTimer.singleShot(0, self.on_first_paint)
+
+    @QtCore.Slot()
+    def on_first_paint(self) -> None:
+        # Records how long it took until the window was shown, so the startup time can be kept track of.
+        startup_seconds = perf_counter() - STARTUP_START_TIME
+        logging.info(f'Window shown after {startup_seconds * 1000.0:.0f}ms, of which '
+                     f'{STARTUP_IMPORT_SECONDS * 1000.0:.0f}ms importing')
+        try:
+            self.startup_report_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.startup_report_path.open('a', encoding='utf-8') as startup_report_file:
+                startup_report_file.write(json.dumps({
+                    'time': wall_time(), 'frozen': getattr(sys, 'frozen', False), 'import_seconds': STARTUP_IMPORT_SECONDS,
+                    'first_paint_seconds': startup_seconds,
+                }) + '\n')
+        except OSError as e:
+            logging.warning(f'Failed to write the startup time to {self.startup_report_path}: {e}')
+
+        # Imports the PDF and OCR libraries in the background, so they're ready once they're needed.
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+        self.searchable_thread.start(QtCore.QThread.Priority.LowestPriority)
 
     @QtCore.Slot()
     def on_view_out_dir_btn_clicked(self) -> None:
@@ -221,9 +459,50 @@ class MyWindowWidget(QtWidgets.QWidget):
     @QtCore.Slot()
     def on_process_btn_clicked(self) -> None:
         converter = Converter.build(self.in_dir_path, self.out_dir_path, self.fail_dir_path, self.temp_dir_path,
-                                    self.finished_dir_path)
-        my_status_window = MyStatusWindow(converter)
-        my_status_window.exec()
+                                    self.finished_dir_path, self.worker_count, self.ocr_mode, self.cache_path,
+                                    self.use_text_layer, self.profiles_path, self.log_path, self.report_path,
+                                    self.temp_max_mb * 1024 * 1024 if self.temp_max_mb > 0 else None,
+                                    self.stage_thread_counts)
+
+        # Pauses the searchable thread, the converter gets all the processing power.
+        self.searchable_thread.paused = True
+        try:
+            my_status_window = MyStatusWindow(converter)
+            my_status_window.exec()
+        finally:
+            self.searchable_thread.paused = False
+
+    @QtCore.Slot(str)
+    def on_search_ln_edit_text_changed(self, text: str) -> None:
+        self.search_results_list.clear()
+
+        # Looks the drawing up in the index of the archive, there's nothing to find without one.
+        archive_index_path = self.out_dir_path / ARCHIVE_INDEX_FILE_NAME
+        if len(text.strip()) == 0 or not archive_index_path.exists():
+            return
+
+        archive_index = ArchiveIndex(archive_index_path)
+        try:
+            drawings = archive_index.search(text)
+        finally:
+            archive_index.close()
+
+        for drawing in drawings:
+            item = QtWidgets.QListWidgetItem(
+                f'{drawing.title()} (revisie {drawing.revision}, '
+                f'{QtCore.QDateTime.fromSecsSinceEpoch(int(drawing.archived)).toString("dd-MM-yyyy HH:mm")}): '
+                f'{drawing.output_path}')
+            item.setData(QtCore.Qt.ItemDataRole.UserRole, str(drawing.output_path))
+            self.search_results_list.addItem(item)
+
+    @QtCore.Slot(QtWidgets.QListWidgetItem)
+    def on_search_results_list_item_activated(self, item: QtWidgets.QListWidgetItem) -> None:
+        QtGui.QDesktopServices.openUrl(QtCore.QUrl.fromLocalFile(item.data(QtCore.Qt.ItemDataRole.UserRole)))
+
+    @QtCore.Slot()
+    def on_about_to_quit(self) -> None:
+        self.searchable_thread.requestInterruption()
+        self.searchable_thread.wait()
 
     @QtCore.Slot()
     def on_select_in_dir_btn_clicked(self) -> None:
@@ -265,6 +544,21 @@ class MyWindowWidget(QtWidgets.QWidget):
         self.finished_dir_txt_ln_edit.setText(str(self.finished_dir_path))
         self.settings.setValue('folders/finished', str(new_finished_dir_path))
 
+    @QtCore.Slot()
+    def on_worker_count_spin_box_value_changed(self, worker_count: int) -> None:
+        self.worker_count = worker_count
+        self.settings.setValue('processing/workers', worker_count)
+
+    @QtCore.Slot()
+    def on_ocr_mode_combo_box_index_changed(self, index: int) -> None:
+        self.ocr_mode = OcrMode(self.ocr_mode_combo_box.itemData(index))
+        self.settings.setValue('processing/ocr_mode', self.ocr_mode.value)
+
+    @QtCore.Slot()
+    def on_use_text_layer_check_box_toggled(self, checked: bool) -> None:
+        self.use_text_layer = checked
+        self.settings.setValue('processing/use_text_layer', 'true' if checked else 'false')
+
     @QtCore.Slot()
     def on_clear_finished_folder_btn_clicked(self) -> None:
         for finished_file_path in self.finished_dir_path.iterdir():
@@ -272,6 +566,9 @@ class MyWindowWidget(QtWidgets.QWidget):
 
 
 if __name__ == '__main__':
+    # Required for the process pool in the packaged executable.
+    multiprocessing.freeze_support()
+
     logging.basicConfig(level=logging.INFO)
 
     settings = QtCore.QSettings("DuflexMechatronics", "DrawingOCR")
@@ -281,4 +578,6 @@ if __name__ == '__main__':
     my_window_widget = MyWindowWidget(settings)
     my_window_widget.show()
 
+    app.aboutToQuit.connect(my_window_widget.on_about_to_quit)
+
     sys.exit(app.exec())
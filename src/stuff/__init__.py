@@ -1 +1,20 @@
-from .converter import Converter, ConverterUpdateEvent, ConverterLogEvent
+from .events import ConverterUpdateEvent, ConverterLogEvent
+from .options import OcrMode
+
+
+def warm_up() -> None:
+    '''
+    Import the modules that do the actual processing, meant to be called in
+    the background once the window is shown, so neither the window nor the
+    first conversion has to wait for them.
+    '''
+    from . import batch, searchable  # noqa: F401
+
+
+def __getattr__(name: str):
+    # The converter is a Qt thread, it's only imported when used so the headless daemon doesn't load Qt.
+    if name == 'Converter':
+        from .converter import Converter
+        return Converter
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,135 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+from time import time
+import sqlite3
+from .store import SqliteStore
+
+# The name of the index in the archive directory, it's kept with the archive it describes.
+ARCHIVE_INDEX_FILE_NAME = '.archive.sqlite3'
+
+# The maximum number of drawings a search returns.
+ARCHIVE_SEARCH_MAX_COUNT = 50
+
+
+def drawing_file_name(project_nr: str, drawing_nr: str, revision: int) -> str:
+    # The first revision keeps the name the archive always had, later ones are numbered.
+    if revision <= 1:
+        return f'{project_nr}.{drawing_nr}.pdf'
+
+    return f'{project_nr}.{drawing_nr}.rev{revision}.pdf'
+
+
+class ArchivedDrawing(object):
+    '''
+    A revision of a drawing in the archive: where it is, the hash of the page
+    it was made from and where that page came from.
+    '''
+
+    def __init__(self, project_nr: str, drawing_nr: str, revision: int, output_path: Path, content_hash: str,
+                 source_path: str, source_page_index: int, archived: float) -> None:
+        self.project_nr = project_nr
+        self.drawing_nr = drawing_nr
+        self.revision = revision
+        self.output_path = output_path
+        self.content_hash = content_hash
+        self.source_path = source_path
+        self.source_page_index = source_page_index
+        self.archived = archived
+
+    def title(self) -> str:
+        return f'{self.project_nr}.{self.drawing_nr}'
+
+
+class ArchiveIndex(SqliteStore):
+    '''
+    On-disk index of every drawing in the archive, so duplicates, revisions
+    and the location of a drawing are looked up without walking the archive.
+
+    A revision is reserved before its file is written and marked written
+    after, so the worker processes of a batch never pick the same one.
+    '''
+
+    def create_schema(self, connection: sqlite3.Connection) -> None:
+        # No WAL here, the archive might be on a network share.
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS drawings (title TEXT NOT NULL, project_nr TEXT NOT NULL, '
+            'drawing_nr TEXT NOT NULL, revision INTEGER NOT NULL, output_path TEXT NOT NULL, '
+            'content_hash TEXT NOT NULL, source_path TEXT NOT NULL, source_page_index INTEGER NOT NULL, '
+            'archived REAL NOT NULL, run_id TEXT NOT NULL, written INTEGER NOT NULL, '
+            'PRIMARY KEY (title, revision))')
+
+    @staticmethod
+    def __drawing(row: tuple) -> ArchivedDrawing:
+        return ArchivedDrawing(row[0], row[1], row[2], Path(row[3]), row[4], row[5], row[6], row[7])
+
+    def search(self, text: str, max_count: int = ARCHIVE_SEARCH_MAX_COUNT) -> list[ArchivedDrawing]:
+        '''
+        Get the drawings of which the title (project number, a dot and the
+        drawing number) starts with the text, newest revision first.
+        '''
+        text = text.strip()
+        rows = self.connect().execute(
+            'SELECT project_nr, drawing_nr, revision, output_path, content_hash, source_path, source_page_index, '
+            'archived FROM drawings WHERE title >= ? AND title < ? AND written = 1 ORDER BY title, revision DESC '
+            'LIMIT ?',
+            (text, text + '\uffff', max_count)).fetchall()
+        return [self.__drawing(row) for row in rows]
+
+    def reserve(self, project_nr: str, drawing_nr: str, dir_path: Path, content_hash: str, source_path: str,
+                source_page_index: int, run_id: str) -> Optional[ArchivedDrawing]:
+        '''
+        Reserve the revision of the drawing a page becomes, or get None if the
+        same page is archived as the drawing already. The file of the
+        revision is expected in the given directory.
+        '''
+        connection = self.connect()
+
+        # Picks the revision and records it in one transaction, which other processes wait for.
+        connection.execute('BEGIN IMMEDIATE')
+        with connection:
+            title = f'{project_nr}.{drawing_nr}'
+            row = connection.execute(
+                'SELECT revision, output_path, run_id, written FROM drawings WHERE title = ? AND content_hash = ? '
+                'ORDER BY revision DESC LIMIT 1', (title, content_hash)).fetchone()
+
+            # Skips the page if it's archived already, or being archived by this run. A revision that went missing
+            #  or that another run didn't get to write is written (again) with this page.
+            if row is not None:
+                (revision, output_path, reserved_run_id, written) = row
+                if (written and Path(output_path).exists()) or (not written and reserved_run_id == run_id):
+                    return None
+            else:
+                # Adds a new revision, the earlier ones are kept. An archive from before the index has the first
+                #  revision of a drawing but no record of it.
+                (latest_revision,) = connection.execute('SELECT MAX(revision) FROM drawings WHERE title = ?',
+                                                        (title,)).fetchone()
+                if latest_revision is not None:
+                    revision = latest_revision + 1
+                elif (dir_path / drawing_file_name(project_nr, drawing_nr, 1)).exists():
+                    revision = 2
+                else:
+                    revision = 1
+
+            drawing = ArchivedDrawing(project_nr, drawing_nr, revision,
+                                      dir_path / drawing_file_name(project_nr, drawing_nr, revision), content_hash,
+                                      source_path, source_page_index, time())
+            connection.execute('INSERT OR REPLACE INTO drawings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)',
+                               (drawing.title(), drawing.project_nr, drawing.drawing_nr, drawing.revision,
+                                str(drawing.output_path), drawing.content_hash, drawing.source_path,
+                                drawing.source_page_index, drawing.archived, run_id))
+
+        return drawing
+
+    def mark_written(self, drawing: ArchivedDrawing) -> None:
+        connection = self.connect()
+        connection.execute('UPDATE drawings SET written = 1, archived = ? WHERE title = ? AND revision = ?',
+                           (time(), drawing.title(), drawing.revision))
+        connection.commit()
+
+    def release(self, drawing: ArchivedDrawing) -> None:
+        # Drops the reservation of a revision that wasn't written, so it can be reserved again.
+        connection = self.connect()
+        connection.execute('DELETE FROM drawings WHERE title = ? AND revision = ? AND written = 0',
+                           (drawing.title(), drawing.revision))
+        connection.commit()
@@ -0,0 +1,351 @@
+from __future__ import annotations
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Optional
+from queue import Empty, Queue
+import multiprocessing
+import uuid
+import logging
+from time import time, perf_counter
+from typing import Callable
+from .events import ConverterUpdateEvent, ConverterLogEvent, ConverterPageEvent
+from .options import OcrMode
+from .processor import FileProcessor
+from .cache import ResultCache
+from .profiles import DetectionProfiles, ProfileStatistics
+from .timing import StageTimings
+from .journal import BatchJournal, JOURNAL_FILE_NAME
+from .searchable import SearchableQueue, SEARCHABLE_QUEUE_FILE_NAME
+from .archive import ArchiveIndex, ARCHIVE_INDEX_FILE_NAME
+from .estimate import FileEstimate, ProgressTracker
+
+# The number of seconds after which a temp file the journal doesn't refer to is taken to be left behind by a crashed
+#  run, a run that's still going writes its temp files well within this.
+TEMP_FILE_STALE_SECONDS = 3600.0
+
+
+def _process_file_in_worker(file_processor: FileProcessor, in_file_path: Path, file_index: int,
+                            event_queue: Queue) -> tuple[ProfileStatistics, StageTimings]:
+    # Forwards all the events to the batch processor, tagged with the index of the file they belong to. The queue
+    #  is a proxy of the manager's queue, which has the interface of a regular queue.
+    file_processor.event_callback = lambda event: event_queue.put((file_index, event))
+    return file_processor.process(in_file_path, file_index)
+
+
+class BatchProcessor(object):
+    '''
+    Processes a batch of input files, either one after the other or in a
+    pool of worker processes. Doesn't depend on Qt, so it's used by both the
+    GUI (through the converter thread) and the headless watcher.
+    '''
+
+    def __init__(self, in_file_paths: list[Path], dir_out_path: Path, dir_manual_path: Path, dir_temp_path: Path,
+                 dir_finished_path: Path, worker_count: int = 1, ocr_mode: OcrMode = OcrMode.FULL,
+                 result_cache: Optional[ResultCache] = None, use_text_layer: bool = True,
+                 detection_profiles: Optional[DetectionProfiles] = None, report_path: Optional[Path] = None,
+                 temp_max_bytes: Optional[int] = None, stage_thread_counts: Optional[dict[str, int]] = None):
+        # Sets the instance variables.
+        self.in_file_paths = in_file_paths
+        self.dir_out_path = dir_out_path
+        self.dir_manual_path = dir_manual_path
+        self.dir_temp_path = dir_temp_path
+        self.dir_finished_path = dir_finished_path
+        self.worker_count = worker_count
+        self.ocr_mode = ocr_mode
+        self.result_cache = result_cache
+        self.use_text_layer = use_text_layer
+        self.detection_profiles = detection_profiles
+        self.report_path = report_path
+        self.temp_max_bytes = temp_max_bytes
+        self.stage_thread_counts = stage_thread_counts
+        self.journal = BatchJournal(dir_temp_path / JOURNAL_FILE_NAME)
+        self.searchable_queue = SearchableQueue(dir_temp_path / SEARCHABLE_QUEUE_FILE_NAME)
+        self.archive_index = ArchiveIndex(dir_out_path / ARCHIVE_INDEX_FILE_NAME)
+
+        # Identifies the temp files of this run.
+        self.run_id = uuid.uuid4().hex[:8]
+
+        # Sets the state instance variables.
+        self.file_index = 0
+        self.profile_statistics = ProfileStatistics()
+        self.stage_timings = StageTimings()
+        self.progress_tracker: Optional[ProgressTracker] = None
+        self.status_message = ''
+        self.failed_file_paths: list[Path] = []
+        self.event_callback: Optional[Callable[[ConverterUpdateEvent | ConverterLogEvent], None]] = None
+
+    @staticmethod
+    def build(dir_in_path: Path, dir_out_path: Path, dir_manual_path: Path, dir_temp_path: Path,
+              dir_finished_path: Path, worker_count: int = 1, ocr_mode: OcrMode = OcrMode.FULL,
+              cache_path: Optional[Path] = None, use_text_layer: bool = True,
+              profiles_path: Optional[Path] = None, in_file_paths: Optional[list[Path]] = None,
+              report_path: Optional[Path] = None, temp_max_bytes: Optional[int] = None,
+              stage_thread_counts: Optional[dict[str, int]] = None) -> BatchProcessor:
+        # Ensures that the input path exists.
+        logging.info(f'Checking if {dir_in_path} exists')
+        if not dir_in_path.exists():
+            raise RuntimeError('Input path does not exist')
+
+        # Ensures that the input path leads to a folder.
+        logging.info(f'Checking if {dir_in_path} is directory')
+        if not dir_in_path.is_dir():
+            raise RuntimeError('Input path is not a directory')
+
+        # Ensures that the worker count makes sense.
+        if worker_count < 1:
+            raise RuntimeError('Worker count must be at least one')
+
+        # Ensures that the output path exists.
+        logging.info(f'Ensuring that the output directory {dir_out_path} exists')
+        dir_out_path.mkdir(parents=True, exist_ok=True)
+
+        # Ensures that the manual path exists.
+        logging.info(f'Ensuring that the manual directory {dir_manual_path} exists')
+        dir_manual_path.mkdir(parents=True, exist_ok=True)
+
+        # Ensures that the temp path exists.
+        logging.info(f'Ensuring that the temp directory {dir_temp_path} exists')
+        dir_temp_path.mkdir(parents=True, exist_ok=True)
+
+        # Ensures that the finished path exists.
+        logging.info(f'Ensuring that the finished directory {dir_finished_path} exists')
+        dir_finished_path.mkdir(parents=True, exist_ok=True)
+
+        # Gets the paths of all the files in the input directory path, unless the files are given.
+        if in_file_paths is None:
+            logging.info(f'Getting all input file paths from the input directory {dir_in_path}')
+            in_file_paths = list(in_file_path for in_file_path in dir_in_path.iterdir() if in_file_path.is_file())
+            logging.info(f'Found {len(in_file_paths)} in the input directory {dir_in_path}')
+
+        # Constructs the result cache, if any.
+        result_cache = None
+        if cache_path is not None:
+            logging.info(f'Using the result cache at {cache_path}')
+            result_cache = ResultCache(cache_path)
+
+        # Loads the title detection profiles.
+        logging.info(f'Loading the detection profiles from {profiles_path}')
+        detection_profiles = DetectionProfiles.load(profiles_path)
+        logging.info(f'Loaded {len(detection_profiles.profiles)} detection profiles')
+
+        # Constructs and returns the batch processor.
+        return BatchProcessor(in_file_paths, dir_out_path, dir_manual_path, dir_temp_path, dir_finished_path,
+                              worker_count, ocr_mode, result_cache, use_text_layer, detection_profiles, report_path,
+                              temp_max_bytes, stage_thread_counts)
+
+    def __emit_event(self, event: ConverterUpdateEvent | ConverterLogEvent) -> None:
+        if self.event_callback is not None:
+            self.event_callback(event)
+
+    def __emit_log_event(self, message: str) -> None:
+        log_event = ConverterLogEvent(time(), message)
+        self.__emit_event(log_event)
+
+    def __emit_status_event(self, message: str) -> None:
+        self.status_message = message
+
+        # The progress is weighted by the estimated cost of the pages, once it's estimated.
+        if self.progress_tracker is not None:
+            status_event = ConverterUpdateEvent(self.progress_tracker.progress(), message,
+                                                self.progress_tracker.pages_per_second(),
+                                                self.progress_tracker.eta_seconds())
+        else:
+            progress = int(min([100.0, (float(self.file_index) / float(len(self.in_file_paths))) * 100.0])) if len(
+                self.in_file_paths) != 0 else 100
+            status_event = ConverterUpdateEvent(progress, message)
+        self.__emit_event(status_event)
+
+    def __handle_file_event(self, event: ConverterUpdateEvent | ConverterLogEvent | ConverterPageEvent) -> None:
+        # Keeps track of the finished pages, and gives the status events of the files the progress of the batch.
+        if isinstance(event, ConverterPageEvent):
+            if self.progress_tracker is not None:
+                self.progress_tracker.page_done(event.file_index, event.page_index)
+                self.__emit_status_event(self.status_message)
+        elif isinstance(event, ConverterUpdateEvent):
+            self.__emit_status_event(event.message)
+        else:
+            self.__emit_event(event)
+
+    def __estimate(self) -> None:
+        # Reads the number and size of the pages of all files, so the progress can be weighted by them.
+        self.__emit_status_event('Estimating the amount of work')
+        with self.stage_timings.measure('estimate'):
+            self.progress_tracker = ProgressTracker([
+                FileEstimate.read(in_file_path) for in_file_path in self.in_file_paths
+            ])
+        self.__emit_log_event(f'Found {self.progress_tracker.total_page_count} pages in {len(self.in_file_paths)} '
+                              f'files, about {self.progress_tracker.total_cost:.1f} A4 pages of work')
+
+    def __record_failed_file(self, in_file_path: Path, error: Exception) -> None:
+        # Leaves the file in the input directory and goes on with the next one, one bad file doesn't stop the batch.
+        logging.error(f'Failed to process file {in_file_path}', exc_info=error)
+        self.__emit_log_event(f'Failed to process file {in_file_path}: {type(error).__name__}: {error}')
+        self.failed_file_paths.append(in_file_path)
+
+    def __build_file_processor(self) -> FileProcessor:
+        return FileProcessor(self.dir_out_path, self.dir_manual_path, self.dir_temp_path, self.dir_finished_path,
+                             len(self.in_file_paths), self.ocr_mode, self.result_cache, self.use_text_layer,
+                             self.detection_profiles, self.journal, self.run_id, self.temp_max_bytes,
+                             self.searchable_queue, self.stage_thread_counts, self.archive_index)
+
+    def __merge_results(self, profile_statistics: ProfileStatistics, stage_timings: StageTimings) -> None:
+        self.profile_statistics.merge(profile_statistics)
+        self.stage_timings.merge(stage_timings)
+
+    def __run_sequential(self) -> None:
+        # Constructs the file processor, which emits its events directly.
+        file_processor = self.__build_file_processor()
+        file_processor.event_callback = self.__handle_file_event
+
+        # Processes all the input files.
+        for (in_file_path_index, in_file_path) in enumerate(self.in_file_paths):
+            self.file_index = in_file_path_index
+            try:
+                self.__merge_results(*file_processor.process(in_file_path, in_file_path_index))
+            except Exception as e:
+                self.__record_failed_file(in_file_path, e)
+            if self.progress_tracker is not None:
+                self.progress_tracker.file_done(in_file_path_index)
+
+    def __run_parallel(self) -> None:
+        self.__emit_log_event(f'Processing {len(self.in_file_paths)} files using {self.worker_count} processes')
+
+        file_processor = self.__build_file_processor()
+
+        with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=self.worker_count) as executor:
+            event_queue = manager.Queue()
+
+            # Submits all the input files to the process pool.
+            futures: list[Future] = [
+                executor.submit(_process_file_in_worker, file_processor, in_file_path, in_file_path_index,
+                                event_queue)
+                for (in_file_path_index, in_file_path) in enumerate(self.in_file_paths)
+            ]
+
+            # The events of the file that's currently being reported are emitted directly, the events
+            #  of files further ahead are held back until all the files before them are finished. This
+            #  way the events reach the status window in the same order as during a sequential run.
+            held_back_events: dict[int, list[ConverterUpdateEvent | ConverterLogEvent]] = {
+                in_file_path_index: [] for in_file_path_index in range(len(self.in_file_paths))
+            }
+
+            def dispatch(event_file_index: int,
+                         event: ConverterUpdateEvent | ConverterLogEvent | ConverterPageEvent) -> None:
+                # The finished pages count right away, whichever file they're of.
+                if isinstance(event, ConverterPageEvent) or event_file_index == self.file_index:
+                    self.__handle_file_event(event)
+                else:
+                    held_back_events[event_file_index].append(event)
+
+            while self.file_index < len(self.in_file_paths):
+                future = futures[self.file_index]
+
+                # Waits for the next event of any of the workers.
+                try:
+                    dispatch(*event_queue.get(timeout=0.1))
+                except Empty:
+                    pass
+
+                if not future.done():
+                    continue
+
+                # All the events of a finished file are in the queue already, so drain it before moving on.
+                while True:
+                    try:
+                        dispatch(*event_queue.get_nowait())
+                    except Empty:
+                        break
+
+                # Records the exception of the worker (if any), just like a sequential run would.
+                try:
+                    self.__merge_results(*future.result())
+                except Exception as e:
+                    self.__record_failed_file(self.in_file_paths[self.file_index], e)
+                if self.progress_tracker is not None:
+                    self.progress_tracker.file_done(self.file_index)
+
+                # Moves on to the next file and emits the events that were held back for it.
+                self.file_index += 1
+                if self.file_index < len(self.in_file_paths):
+                    for event in held_back_events.pop(self.file_index):
+                        self.__handle_file_event(event)
+
+    def __clear_stale_temp_files(self) -> None:
+        # Clears what crashed runs left behind: the intermediates of files which changed or are gone, and the temp
+        #  files nothing refers to, like partial OCR output. The recent ones might be of a run that's still going.
+        stale_time = time() - TEMP_FILE_STALE_SECONDS
+        in_file_keys = set()
+        for in_file_path in self.in_file_paths:
+            try:
+                in_file_keys.add(BatchJournal.file_key(in_file_path))
+            except FileNotFoundError:
+                continue
+        self.journal.drop_intermediates(in_file_keys, stale_time)
+
+        intermediate_file_names = {path.name for path in self.journal.intermediate_file_paths()}
+        for temp_file_path in self.dir_temp_path.iterdir():
+            # The journal and the searchable queue are hidden, they aren't temp files.
+            if temp_file_path.name.startswith('.') or temp_file_path.name in intermediate_file_names or (
+                    not temp_file_path.is_file()):
+                continue
+            try:
+                if temp_file_path.stat().st_mtime >= stale_time:
+                    continue
+                self.__emit_log_event(f'Unlinking temp file {temp_file_path} left behind by an earlier run')
+                temp_file_path.unlink()
+            except FileNotFoundError:
+                continue
+
+    def __clear_temp_files(self) -> None:
+        # Each temp file is unlinked once its file is finished, this only clears what's left of this run. The
+        #  files of other runs are left alone, they might still be running or resumed later.
+        self.__emit_log_event('Clearing temp files')
+        for temp_file in self.dir_temp_path.glob(f'{self.run_id}.*'):
+            self.__emit_log_event(f'Unlinking temp file {temp_file}')
+            temp_file.unlink()
+
+    def run(self) -> None:
+        start_time = perf_counter()
+        try:
+            self.__clear_stale_temp_files()
+            self.__estimate()
+
+            # Processes all the input files.
+            if self.worker_count > 1 and len(self.in_file_paths) > 1:
+                self.__run_parallel()
+            else:
+                self.__run_sequential()
+        finally:
+            # Closes the cache, also when the batch fails so the files aren't held open. The Tesseract handles are
+            #  kept for the next batch, the pool cleans them up once they're unused for a while.
+            if self.result_cache is not None:
+                self.result_cache.close()
+            self.journal.close()
+            self.searchable_queue.close()
+            self.archive_index.close()
+
+        # Sets the file index to the length to indicate we've processed all.
+        self.file_index = len(self.in_file_paths)
+
+        # Clears the temp files.
+        self.__clear_temp_files()
+
+        # Logs which files are left in the input directory.
+        if len(self.failed_file_paths) != 0:
+            self.__emit_log_event(f'Failed to process {len(self.failed_file_paths)} files, they\'re left in the input '
+                                  f'directory')
+
+        # Logs how well the detection profiles performed.
+        for line in self.profile_statistics.summary():
+            self.__emit_log_event(line)
+
+        # Logs where the time went, and appends the report to the report file.
+        elapsed_seconds = perf_counter() - start_time
+        for line in self.stage_timings.summary(elapsed_seconds):
+            self.__emit_log_event(line)
+        if self.report_path is not None:
+            self.__emit_log_event(f'Appending the run report to {self.report_path}')
+            self.stage_timings.export(self.report_path, elapsed_seconds)
+
+        # Emits the event indicating we're finished.
+        self.__emit_status_event('Finished')
@@ -0,0 +1,271 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+from PIL import Image as ImageModule, ImageDraw, ImageFont
+from PyPDF2 import PdfWriter
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject
+from time import perf_counter, time
+import argparse
+import json
+import logging
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from .options import OcrMode, parse_stage_thread_counts
+from .profiles import TITLE_DETECT_CENTER_X, TITLE_DETECT_CENTER_Y
+from .batch import BatchProcessor
+from .timing import peak_memory_usage
+
+# The sizes (in points) of the generated sheets, all in landscape.
+BENCHMARK_PAGE_SIZES = {
+    'A4': (842.0, 595.0),
+    'A3': (1191.0, 842.0),
+    'A2': (1684.0, 1191.0),
+}
+
+# The rotations the sheets are scanned with.
+BENCHMARK_ROTATIONS = [0, 90, 180, 270]
+
+# The resolution the scanned sheets are generated at.
+BENCHMARK_SCAN_DPI = 150
+
+# The title is at the same distance from the bottom right corner on every sheet size, like on the original sheets.
+TITLE_OFFSET_X = BENCHMARK_PAGE_SIZES['A4'][0] - TITLE_DETECT_CENTER_X
+TITLE_OFFSET_Y = TITLE_DETECT_CENTER_Y
+
+TITLE_FONT_SIZE = 10
+
+
+class BenchmarkPage(object):
+    '''
+    A generated page together with the title it has, which is the ground
+    truth the result of the pipeline is compared with.
+    '''
+
+    def __init__(self, size_name: str, rotation: int, scanned: bool, project_nr: str, drawing_nr: str) -> None:
+        self.size_name = size_name
+        self.rotation = rotation
+        self.scanned = scanned
+        self.project_nr = project_nr
+        self.drawing_nr = drawing_nr
+
+    def title_center(self) -> tuple[float, float]:
+        (width, _) = BENCHMARK_PAGE_SIZES[self.size_name]
+        return width - TITLE_OFFSET_X, TITLE_OFFSET_Y
+
+    def to_dict(self) -> dict:
+        return {'size': self.size_name, 'rotation': self.rotation, 'scanned': self.scanned,
+                'project_nr': self.project_nr, 'drawing_nr': self.drawing_nr}
+
+
+def load_font(size: int) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
+    try:
+        return ImageFont.truetype('DejaVuSans.ttf', size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+def render_scanned_page(page: BenchmarkPage, rng: random.Random) -> ImageModule.Image:
+    '''
+    Draw the page like it came from the scanner: some lines like those of a
+    drawing, the title at the detection point and rotated by the rotation of
+    the page.
+    '''
+    (width, height) = BENCHMARK_PAGE_SIZES[page.size_name]
+    pixels_per_point = BENCHMARK_SCAN_DPI / 72.0
+    image = ImageModule.new('L', (int(width * pixels_per_point), int(height * pixels_per_point)), 255)
+    draw = ImageDraw.Draw(image)
+
+    # Draws the frame and some lines, the title block area is left empty.
+    draw.rectangle((10, 10, image.width - 10, image.height - 10), outline=0, width=3)
+    for _ in range(40):
+        draw.line((rng.randrange(20, image.width - 20), rng.randrange(20, image.height // 2),
+                   rng.randrange(20, image.width - 20), rng.randrange(20, image.height // 2)), fill=0, width=2)
+
+    # Draws the title, centered on the detection point. Note that PDF coordinates start at the bottom.
+    (center_x, center_y) = page.title_center()
+    draw.text((center_x * pixels_per_point, image.height - center_y * pixels_per_point),
+              f'{page.project_nr}.{page.drawing_nr}', fill=0, anchor='mm',
+              font=load_font(int(TITLE_FONT_SIZE * pixels_per_point)))
+
+    # Rotates the page clockwise, like a sheet put sideways into the scanner.
+    return image.rotate(-page.rotation, expand=True) if page.rotation != 0 else image
+
+
+def add_text_page(pdf_writer: PdfWriter, page: BenchmarkPage) -> None:
+    # Adds a page with real text, like the ones exported from CAD software.
+    (width, height) = BENCHMARK_PAGE_SIZES[page.size_name]
+    pdf_writer.add_blank_page(width, height)
+    pdf_page = pdf_writer.pages[-1]
+
+    font = DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    })
+    pdf_page[NameObject('/Resources')] = DictionaryObject({
+        NameObject('/Font'): DictionaryObject({NameObject('/F1'): pdf_writer._add_object(font)}),
+    })
+
+    # Places the title so its center is at the detection point, Helvetica digits are about half the font size wide.
+    title = f'{page.project_nr}.{page.drawing_nr}'
+    (center_x, center_y) = page.title_center()
+    title_x = center_x - len(title) * TITLE_FONT_SIZE * 0.55 / 2.0
+    title_y = center_y - TITLE_FONT_SIZE * 0.35
+    contents = DecodedStreamObject()
+    contents.set_data(f'BT /F1 {TITLE_FONT_SIZE} Tf {title_x:.2f} {title_y:.2f} Td ({title}) Tj ET'.encode())
+    pdf_page[NameObject('/Contents')] = ArrayObject([pdf_writer._add_object(contents)])
+
+
+def generate_corpus(dir_path: Path, file_count: int, max_page_count: int, scanned_fraction: float,
+                    seed: int) -> list[BenchmarkPage]:
+    '''
+    Generate the input files, the same seed always gives the same files. The
+    pages get a unique title each, in the order of the files and pages.
+    '''
+    rng = random.Random(seed)
+    dir_path.mkdir(parents=True, exist_ok=True)
+
+    pages: list[BenchmarkPage] = []
+    for file_index in range(file_count):
+        file_pages = [
+            BenchmarkPage(rng.choice(list(BENCHMARK_PAGE_SIZES)), rng.choice(BENCHMARK_ROTATIONS),
+                          rng.random() < scanned_fraction, f'{rng.randrange(1000, 10000)}',
+                          f'{len(pages) + page_index + 1:02d}.{rng.randrange(1, 10)}')
+            for page_index in range(rng.randint(1, max_page_count))
+        ]
+
+        # Writes the file, the scanned pages are images in a PDF of their own and are merged in.
+        pdf_writer = PdfWriter()
+        for page in file_pages:
+            if page.scanned:
+                with tempfile.TemporaryFile() as scan_file:
+                    render_scanned_page(page, rng).save(scan_file, 'PDF', resolution=BENCHMARK_SCAN_DPI)
+                    scan_file.seek(0)
+                    pdf_writer.append(scan_file)
+            else:
+                page.rotation = 0
+                add_text_page(pdf_writer, page)
+
+        with (dir_path / f'drawing{file_index:04d}.pdf').open('wb') as file:
+            pdf_writer.write(file)
+
+        pages.extend(file_pages)
+
+    return pages
+
+
+def write_profiles(path: Path) -> None:
+    # Writes a detection profile for each sheet size, with the title at the same place as on the generated pages.
+    path.write_text(json.dumps([
+        {'name': size_name, 'center_x': width - TITLE_OFFSET_X, 'center_y': TITLE_OFFSET_Y,
+         'page_width': width, 'page_height': height}
+        for size_name, (width, height) in BENCHMARK_PAGE_SIZES.items()
+    ], indent=2), encoding='utf-8')
+
+
+def measure_accuracy(dir_out_path: Path, dir_manual_path: Path, pages: list[BenchmarkPage]) -> dict[str, int]:
+    # The archived files are named after the title, so they tell which titles were found.
+    expected_titles = {(page.project_nr, page.drawing_nr) for page in pages}
+    found_titles = set()
+    for out_file_path in dir_out_path.rglob('*.pdf'):
+        (project_nr, _, drawing_nr) = out_file_path.stem.partition('.')
+        found_titles.add((project_nr, drawing_nr))
+
+    return {
+        'correct': len(expected_titles & found_titles),
+        'wrong': len(found_titles - expected_titles),
+        'manual': sum(1 for _ in dir_manual_path.glob('*.pdf')),
+        'total': len(expected_titles),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure_import_seconds() -> Optional[float]:
+    # Imports the window in a fresh interpreter, like at startup, the PDF and OCR libraries should stay out of it.
+    try:
+        return float(subprocess.run(
+            [sys.executable, '-c', 'from time import perf_counter; start_time = perf_counter(); import main; '
+                                   'print(perf_counter() - start_time)'],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).parent.parent).stdout.strip())
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Run the pipeline on a generated corpus of drawings.')
+    parser.add_argument('--files', type=int, default=10, help='number of files to generate')
+    parser.add_argument('--max-pages', type=int, default=4, help='maximum number of pages per file')
+    parser.add_argument('--scanned', type=float, default=1.0, help='fraction of the pages that are scanned')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--ocr-mode', choices=[mode.value for mode in OcrMode], default=OcrMode.FULL.value)
+    parser.add_argument('--threads', type=parse_stage_thread_counts, default=None,
+                        help='threads per stage of the page pipeline, like rasterize=2,orientation=4,recognize=2')
+    parser.add_argument('--no-text-layer', action='store_true', help='always use OCR, even if a page has text')
+    parser.add_argument('--work-dir', type=Path, default=None, help='directory to run in, temporary by default')
+    parser.add_argument('--results', type=Path, default=None, help='path of the JSON lines file results are added to')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    work_dir_path = args.work_dir if args.work_dir is not None else Path(tempfile.mkdtemp(prefix='benchmark-'))
+    try:
+        # Generates the corpus, a fresh one each time so no earlier output is counted.
+        for name in ['Import', 'Archief', 'Handmatig', 'Verwerkt', 'Temp']:
+            shutil.rmtree(work_dir_path / name, ignore_errors=True)
+        logging.info(f'Generating {args.files} files in {work_dir_path}')
+        pages = generate_corpus(work_dir_path / 'Import', args.files, args.max_pages, args.scanned, args.seed)
+        profiles_path = work_dir_path / 'profiles.json'
+        write_profiles(profiles_path)
+
+        # Runs the pipeline, without cache so every run does all the work.
+        batch_processor = BatchProcessor.build(work_dir_path / 'Import', work_dir_path / 'Archief',
+                                               work_dir_path / 'Handmatig', work_dir_path / 'Temp',
+                                               work_dir_path / 'Verwerkt', args.workers, OcrMode(args.ocr_mode),
+                                               None, not args.no_text_layer, profiles_path,
+                                               stage_thread_counts=args.threads)
+        start_time = perf_counter()
+        batch_processor.run()
+        elapsed_seconds = perf_counter() - start_time
+
+        # The peak of this process or any of the workers, whichever is highest.
+        peak_memories = [memory for memory in [peak_memory_usage(), batch_processor.stage_timings.peak_memory()]
+                         if memory is not None]
+
+        result = {
+            'time': time(),
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'settings': {'files': args.files, 'max_pages': args.max_pages, 'scanned': args.scanned,
+                         'seed': args.seed, 'workers': args.workers, 'ocr_mode': args.ocr_mode,
+                         'text_layer': not args.no_text_layer, 'threads': args.threads},
+            'page_count': len(pages),
+            'seconds': elapsed_seconds,
+            'pages_per_second': len(pages) / elapsed_seconds if elapsed_seconds > 0.0 else 0.0,
+            'peak_memory': max(peak_memories) if len(peak_memories) != 0 else None,
+            'accuracy': measure_accuracy(work_dir_path / 'Archief', work_dir_path / 'Handmatig', pages),
+            'stages': batch_processor.stage_timings.stage_statistics(),
+            'startup_import_seconds': measure_import_seconds(),
+        }
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir_path, ignore_errors=True)
+
+    # Prints the result, and adds it to the results so runs on different commits can be compared.
+    print(json.dumps(result, indent=2))
+    if args.results is not None:
+        args.results.parent.mkdir(parents=True, exist_ok=True)
+        with args.results.open('a', encoding='utf-8') as results_file:
+            results_file.write(json.dumps(result) + '\n')
+
+    return 0
@@ -0,0 +1,113 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+from PyPDF2 import PageObject
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject, IndirectObject
+from time import time
+import hashlib
+import sqlite3
+from .profiles import page_rotation
+from .store import SqliteStore
+
+# The maximum number of pages of which the result is kept, the least recently used ones are evicted first.
+CACHE_MAX_SIZE = 100000
+
+
+def hash_page(page: PageObject) -> str:
+    '''
+    Compute a hash of everything that determines how a page looks: its
+    boxes, rotation, content streams and the (image) XObjects it draws.
+    '''
+    page_hash = hashlib.sha256()
+    page_hash.update(repr([float(v) for v in page.mediabox]).encode())
+    page_hash.update(repr(page_rotation(page)).encode())
+
+    # The contents are either a single stream or an array of them, which are drawn one after the other.
+    contents = page.get('/Contents')
+    if isinstance(contents, IndirectObject):
+        contents = contents.get_object()
+    for content in contents if isinstance(contents, ArrayObject) else [contents]:
+        if isinstance(content, IndirectObject):
+            content = content.get_object()
+        if isinstance(content, (DecodedStreamObject, EncodedStreamObject)):
+            data = content.get_data()
+            page_hash.update(data.encode() if isinstance(data, str) else data or b'')
+
+    # Hashes the raw (still encoded) data of the XObjects, this is what differs between scans.
+    visited = set()
+    pending = [page.get('/Resources')]
+    while len(pending) != 0:
+        resources = pending.pop()
+        if isinstance(resources, IndirectObject):
+            resources = resources.get_object()
+        xobjects = resources.get('/XObject') if isinstance(resources, DictionaryObject) else None
+        if isinstance(xobjects, IndirectObject):
+            xobjects = xobjects.get_object()
+        if not isinstance(xobjects, DictionaryObject):
+            continue
+
+        for name, xobject in sorted(xobjects.items()):
+            if isinstance(xobject, IndirectObject):
+                if xobject.idnum in visited:
+                    continue
+                visited.add(xobject.idnum)
+                xobject = xobject.get_object()
+
+            page_hash.update(name.encode())
+            page_hash.update(getattr(xobject, '_data', b''))
+
+            # Forms have resources of their own.
+            if xobject.get('/Subtype') == '/Form':
+                pending.append(xobject.get('/Resources'))
+
+    return page_hash.hexdigest()
+
+
+class CachedResult(object):
+    def __init__(self, angle: int, project_nr: Optional[str], drawing_nr: Optional[str]) -> None:
+        self.angle = angle
+        self.project_nr = project_nr
+        self.drawing_nr = drawing_nr
+
+
+class ResultCache(SqliteStore):
+    '''
+    On-disk cache of the orientation and title of pages, keyed by the hash of
+    the page.
+    '''
+
+    def __init__(self, path: Path, max_size: int = CACHE_MAX_SIZE):
+        super().__init__(path)
+        self.max_size = max_size
+
+    def create_schema(self, connection: sqlite3.Connection) -> None:
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS results (page_hash TEXT PRIMARY KEY, angle INTEGER NOT NULL, '
+            'project_nr TEXT, drawing_nr TEXT, last_used REAL NOT NULL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+
+    def get(self, page_hash: str) -> Optional[CachedResult]:
+        connection = self.connect()
+        row = connection.execute('SELECT angle, project_nr, drawing_nr FROM results WHERE page_hash = ?',
+                                 (page_hash,)).fetchone()
+        if row is None:
+            return None
+
+        # Marks the result as recently used, so it's evicted last.
+        connection.execute('UPDATE results SET last_used = ? WHERE page_hash = ?', (time(), page_hash))
+        connection.commit()
+
+        return CachedResult(row[0], row[1], row[2])
+
+    def put(self, page_hash: str, result: CachedResult) -> None:
+        connection = self.connect()
+        connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                           (page_hash, result.angle, result.project_nr, result.drawing_nr, time()))
+
+        # Evicts the least recently used results if the cache grew too large.
+        (size,) = connection.execute('SELECT COUNT(*) FROM results').fetchone()
+        if size > self.max_size:
+            connection.execute(
+                'DELETE FROM results WHERE page_hash IN (SELECT page_hash FROM results ORDER BY last_used LIMIT ?)',
+                (size - self.max_size,))
+        connection.commit()
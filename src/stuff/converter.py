@@ -1,335 +1,160 @@
 from __future__ import annotations
+from collections import deque
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from PyPDF2 import PdfReader, PageObject, PdfWriter
-from pyocr import pyocr
-from pdf2image import pdf2image
+from typing import Optional, TYPE_CHECKING
+from time import sleep
+import datetime
 import logging
-import math
-from pdfminer.high_level import extract_pages
-from pdfminer.layout import LTTextContainer, LTPage
-from time import time, sleep
+import threading
 from PySide6 import QtCore
-import re
+from .events import ConverterUpdateEvent, ConverterLogEvent
+from .options import OcrMode
 
-TITLE_DETECT_CENTER_X = 730.98
-TITLE_DETECT_CENTER_Y = 64.752
-TITLE_DETECT_TOLERNACE = 15
+# The batch processor pulls in the PDF and OCR libraries, it's only imported once it's used so the window
+#  shows without waiting for them.
+if TYPE_CHECKING:
+    from .batch import BatchProcessor
 
+# The maximum number of log events kept until the window takes them, older ones are only in the log file.
+PENDING_LOG_EVENTS_MAX_COUNT = 1000
 
-class TesseractsPdfBuilder(object):
-    def __init__(self):
-        self.images = []
-        self.output_file = None
-        self.lang = None
-        self.text_only = False
+# The maximum size of the log file before it's rotated, and the number of rotated files kept.
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUP_COUNT = 5
 
-    def set_lang(self, lang):
-        self.lang = lang
-        return self
+# The number of seconds the searchable thread sleeps when there's nothing to do, or while it's paused.
+SEARCHABLE_IDLE_INTERVAL = 5.0
 
-    def set_output_file(self, output_file):
-        self.output_file = output_file
-        return self
-
-    def set_text_only(self, text_only):
-        self.text_only = text_only
-        return self
-
-    def add_image(self, img):
-        self.images.append(img)  # or something else
-        return self
-
-    def __validate(self):
-        if len(self.images) < 1:
-            raise ValueError(
-                "At least one image is required to build the pdf!"
-            )
-
-        if self.output_file is None:
-            raise ValueError("An output-file is required to build the pdf!")
-
-    def build(self):
-        '''
-        Create and write PDF file.
-        '''
-        self.__validate()
-
-        handle = pyocr.libtesseract.tesseract_raw.init(lang=self.lang)
-        renderer = None
-        try:
-            pyocr.libtesseract.tesseract_raw.set_page_seg_mode(
-                handle, pyocr.libtesseract.tesseract_raw.PageSegMode.SPARSE_TEXT
-            )
-
-            renderer = pyocr.libtesseract.tesseract_raw.init_pdf_renderer(
-                handle, self.output_file, self.text_only
-            )
-            assert renderer
-
-            pyocr.libtesseract.tesseract_raw.begin_document(renderer, "")
-
-            for image in self.images:
-                pyocr.libtesseract.tesseract_raw.set_image(handle, image)
-
-                # tesseract_raw.set_input_name(handle, input_file)
-                pyocr.libtesseract.tesseract_raw.recognize(handle)
-
-                pyocr.libtesseract.tesseract_raw.add_renderer_image(handle, renderer)
-            pyocr.libtesseract.tesseract_raw.end_document(renderer)
-        finally:
-            pyocr.libtesseract.tesseract_raw.cleanup(handle)
-            if renderer:
-                pyocr.libtesseract.tesseract_raw.cleanup(renderer)
-
-
-class ConverterUpdateEvent:
-    def __init__(self, progress: int, message: str) -> None:
-        self.progress = progress
-        self.message = message
-
-    def __str__(self):
-        return f'{self.progress}: {self.message}'
-
-
-class ConverterLogEvent:
-    def __init__(self, t: float, message: str) -> None:
-        self.t = t
-        self.message = message
-
-    def __str__(self):
-        return f'{self.t}: {self.message}'
+# The logger the full log is written to, it doesn't propagate so the console isn't flooded.
+event_logger = logging.getLogger(f'{__name__}.events')
+event_logger.propagate = False
+event_logger.setLevel(logging.INFO)
 
 
 class Converter(QtCore.QThread):
-    status_signal = QtCore.Signal(ConverterUpdateEvent, name='status')
-    log_signal = QtCore.Signal(ConverterLogEvent, name='log')
+    '''
+    Runs the batch processor in the background. The events aren't sent to the
+    window one by one, but collected here and taken by the window at its own
+    rate, only the latest status event is kept.
+    '''
 
-    def __init__(self, in_file_paths: list[Path], dir_out_path: Path, dir_manual_path: Path, dir_temp_path: Path,
-                 dir_finished_path: Path):
+    def __init__(self, batch_processor: BatchProcessor, log_path: Optional[Path] = None):
         super().__init__()
 
-        # Sets the instance variables.
-        self.in_file_paths = in_file_paths
-        self.dir_out_path = dir_out_path
-        self.dir_manual_path = dir_manual_path
-        self.dir_temp_path = dir_temp_path
-        self.dir_finished_path = dir_finished_path
+        # Sets the instance variables, the events of the batch processor are collected.
+        self.batch_processor = batch_processor
+        self.batch_processor.event_callback = self.__collect_event
+        self.log_path = log_path
 
         # Sets the state instance variables.
-        self.file_index = 0
+        self.events_lock = threading.Lock()
+        self.pending_status_event: Optional[ConverterUpdateEvent] = None
+        self.pending_log_events: deque[ConverterLogEvent] = deque(maxlen=PENDING_LOG_EVENTS_MAX_COUNT)
+        self.dropped_log_event_count = 0
 
     @staticmethod
     def build(dir_in_path: Path, dir_out_path: Path, dir_manual_path: Path, dir_temp_path: Path,
-              dir_finished_path: Path) -> Converter:
-        # Ensures that the input path exists.
-        logging.info(f'Checking if {dir_in_path} exists')
-        if not dir_in_path.exists():
-            raise RuntimeError('Input path does not exist')
-
-        # Ensures that the input path leads to a folder.
-        logging.info(f'Checking if {dir_in_path} is directory')
-        if not dir_in_path.is_dir():
-            raise RuntimeError('Input path is not a directory')
-
-        # Ensures that the output path exists.
-        logging.info(f'Ensuring that the output directory {dir_out_path} exists')
-        dir_out_path.mkdir(parents=True, exist_ok=True)
-
-        # Ensures that the manual path exists.
-        logging.info(f'Ensuring that the manual directory {dir_manual_path} exists')
-        dir_manual_path.mkdir(parents=True, exist_ok=True)
-
-        # Ensures that the temp path exists.
-        logging.info(f'Ensuring that the temp directory {dir_temp_path} exists')
-        dir_temp_path.mkdir(parents=True, exist_ok=True)
-
-        # Ensures that the finished path exists.
-        logging.info(f'Ensuring that the finished directory {dir_finished_path} exists')
-        dir_finished_path.mkdir(parents=True, exist_ok=True)
-
-        # Gets the paths of all the files in the input directory path.
-        logging.info(f'Getting all input file paths from the input directory {dir_in_path}')
-        in_file_paths = list(in_file_path for in_file_path in dir_in_path.iterdir() if in_file_path.is_file())
-        logging.info(f'Found {len(in_file_paths)} in the input directory {dir_in_path}')
+              dir_finished_path: Path, worker_count: int = 1, ocr_mode: OcrMode = OcrMode.FULL,
+              cache_path: Optional[Path] = None, use_text_layer: bool = True,
+              profiles_path: Optional[Path] = None, log_path: Optional[Path] = None,
+              report_path: Optional[Path] = None, temp_max_bytes: Optional[int] = None,
+              stage_thread_counts: Optional[dict[str, int]] = None) -> Converter:
+        from .batch import BatchProcessor
 
         # Constructs and returns the converter.
-        return Converter(in_file_paths, dir_out_path, dir_manual_path, dir_temp_path, dir_finished_path)
-
-    def __emit_log_event(self, message: str) -> None:
-        log_event = ConverterLogEvent(time(), message)
-        self.log_signal.emit(log_event)
-
-    def __emit_status_event(self, message: str) -> None:
-        progress = int(min([100.0, (float(self.file_index) / float(len(self.in_file_paths))) * 100.0])) if len(
-            self.in_file_paths) != 0 else 100
-        status_event = ConverterUpdateEvent(progress, message)
-        self.status_signal.emit(status_event)
-
-    def __run_perform_ocr_on_pdf(self, in_file_path: Path) -> Path:
-        # Obtains the images from the PDF file.
-        self.__emit_status_event(f'Obtaining images from PDF file {in_file_path}')
-        self.__emit_log_event(f'Obtaining images from PDF file {in_file_path}')
-        pdf_images = pdf2image.convert_from_path(in_file_path, dpi=200, fmt='jpg')
-
-        # Constructs the PDF builder.
-        pdf_builder = TesseractsPdfBuilder()
-
-        # Loops over all the pdf images and rotates them so they're aligned
-        #  properly. Then adds them to the PDF builder.
-        for pdf_image_index, pdf_image in enumerate(pdf_images):
-            # Detects the orientation of the document.
-            self.__emit_status_event(f'Detecting orientation of page {pdf_image_index} from file {in_file_path}')
-            try:
-                angle = pyocr.libtesseract.detect_orientation(pdf_image, lang='nld')['angle']
-                self.__emit_log_event(f'Detected orientation of angle {angle} for page {pdf_image_index}')
-            except pyocr.libtesseract.TesseractError:
-                angle = 0
-                self.__emit_log_event(f'Orientation detection failed for page {pdf_image_index}')
-
-            # Rotates the image based on the detected angle.
-            self.__emit_log_event(f'Rotating page {pdf_image_index} by angle {angle}')
-            self.__emit_status_event(f'Rotating page {pdf_image_index} from file {in_file_path} by {angle}')
-            pdf_image = pdf_image.rotate(angle, expand=True)
-
-            # Adds the page to the output pdf.
-            self.__emit_log_event(f'Adding page {pdf_image_index} to output pdf')
-            pdf_builder.add_image(pdf_image)
-
-        # Builds the PDF file.
-        self.__emit_status_event(f'Performing OCR on file {in_file_path}')
-        temp_file_path = self.dir_temp_path / f'{in_file_path.stem}'
-        pdf_builder.set_output_file(str(temp_file_path))
-        pdf_builder.set_lang('nld')
-        pdf_builder.build()
-
-        # Finishes off and returns the path with the file ending with the PDF extension.
-        self.__emit_log_event(
-            f'Finished OCR for file with path {in_file_path}, wrote OCR\'ed file to path {temp_file_path}')
-        return temp_file_path.with_suffix('.pdf')
-
-    def __process_page(self, temp_file_page_index: int, temp_file_reader_page: PageObject,
-                       temp_file_page: LTPage) -> None:
-        project_nr = None
-        drawing_nr = None
-
-        # Gets all the text elements.
-        self.__emit_log_event(f'Getting all text elements in page')
-        text_elements = [e for e in temp_file_page if isinstance(e, LTTextContainer)]
-        self.__emit_log_event(f'Found {len(text_elements)} text elements on page {temp_file_page_index} of pdf file')
-
-        # Loops over all the text elements.
-        self.__emit_log_event(f'Attempting to find title of document')
-        for text_element in text_elements:
-            # Computes the center of the element.
-            element_center_x = (text_element.x1 - text_element.x0) / 2 + text_element.x0
-            element_center_y = (text_element.y1 - text_element.y0) / 2 + text_element.y0
-
-            # Computes the distance between the centers.
-            element_center_dist = math.sqrt(
-                math.pow(element_center_x - TITLE_DETECT_CENTER_X, 2) + math.pow(
-                    element_center_y - TITLE_DETECT_CENTER_Y, 2))
-            if element_center_dist > TITLE_DETECT_TOLERNACE:
-                continue
-
-            # Gets the text from the element.
-            title = text_element.get_text()
-
-            # Attempts to get the project number and the drawing number from the title.
-            match = re.search(r'([0-9]+)\.([0-9.]+)', title)
-            if match is not None:
-                # Gets the project number and the drawing number.
-                project_nr = match.group(1)
-                drawing_nr = match.group(2)
-
-                # Prints that we detected the project and drawing number.
-                self.__emit_log_event(
-                    f'Detected project number {project_nr} and drawing number {drawing_nr} for '
-                    f'page {temp_file_page_index}')
-
-                # Writes the page to the appropriate file.
-                self.__write_succeeded_page(project_nr, drawing_nr, temp_file_reader_page)
-            else:
-                self.__emit_log_event(f'Failed to detect title for page {temp_file_page_index}')
-
-            # We found the element, so just exit.
-            break
-
-        # Checks to which path the output page should be written.
-        if project_nr is not None and drawing_nr is not None:
-            self.__write_succeeded_page(project_nr, drawing_nr, temp_file_reader_page)
-        else:
-            self.__write_failed_page(temp_file_reader_page)
-
-    def __process_temp_file(self, temp_file_path: Path) -> None:
-        # Opens the temp file.
-        self.__emit_log_event(f'Opening temp file {temp_file_path}')
-        with temp_file_path.open('rb') as temp_file:
-            # Reads the temp file.
-            self.__emit_log_event(f'Reading temp file {temp_file_path}')
-            temp_file_reader = PdfReader(temp_file)
-            temp_file_pages = extract_pages(temp_file_path)
+        return Converter(BatchProcessor.build(dir_in_path, dir_out_path, dir_manual_path, dir_temp_path,
+                                              dir_finished_path, worker_count, ocr_mode, cache_path, use_text_layer,
+                                              profiles_path, report_path=report_path,
+                                              temp_max_bytes=temp_max_bytes,
+                                              stage_thread_counts=stage_thread_counts), log_path)
+
+    def __collect_event(self, event: ConverterUpdateEvent | ConverterLogEvent) -> None:
+        if isinstance(event, ConverterUpdateEvent):
+            with self.events_lock:
+                self.pending_status_event = event
+            return
+
+        # Streams the log event to the log file, from this thread so the window isn't slowed down.
+        event_logger.info(f'{datetime.datetime.fromtimestamp(event.t).isoformat(timespec="milliseconds")} '
+                          f'{event.message}')
+
+        with self.events_lock:
+            if len(self.pending_log_events) == self.pending_log_events.maxlen:
+                self.dropped_log_event_count += 1
+            self.pending_log_events.append(event)
+
+    def take_events(self) -> tuple[Optional[ConverterUpdateEvent], list[ConverterLogEvent], int]:
+        '''
+        Take the collected events: the latest status event (if any), the log
+        events and the number of log events dropped since the last call.
+        '''
+        with self.events_lock:
+            status_event = self.pending_status_event
+            log_events = list(self.pending_log_events)
+            dropped_log_event_count = self.dropped_log_event_count
 
-            # Processes all the pages.
-            for temp_file_page_index, (temp_file_reader_page, temp_file_page) in enumerate(
-                    zip(temp_file_reader.pages, temp_file_pages)):
-                self.__process_page(temp_file_page_index, temp_file_reader_page, temp_file_page)
+            self.pending_status_event = None
+            self.pending_log_events.clear()
+            self.dropped_log_event_count = 0
 
-    def __clear_temp_files(self) -> None:
-        self.__emit_log_event('Clearing temp files')
-        for temp_file in self.dir_temp_path.iterdir():
-            self.__emit_log_event(f'Unlinking temp file {temp_file}')
-            temp_file.unlink()
+        return status_event, log_events, dropped_log_event_count
 
     def run(self) -> None:
-        # Allows progress animation.
-        sleep(0.5)
-
-        # Processes all the input files.
-        for (in_file_path_index, in_file_path) in enumerate(self.in_file_paths):
-            self.file_index = in_file_path_index
-            temp_file_path = self.__run_perform_ocr_on_pdf(in_file_path)
-            self.__process_temp_file(temp_file_path)
-            self.__move_finished_file(in_file_path)
+        # Opens the log file, if any.
+        log_file_handler = None
+        if self.log_path is not None:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            log_file_handler = RotatingFileHandler(self.log_path, maxBytes=LOG_FILE_MAX_BYTES,
+                                                   backupCount=LOG_FILE_BACKUP_COUNT, encoding='utf-8')
+            event_logger.addHandler(log_file_handler)
 
-        # Sets the file index to the length to indicate we've processed all.
-        self.file_index = len(self.in_file_paths)
-
-        # Clears the temp files.
-        self.__clear_temp_files()
+        try:
+            # Allows progress animation.
+            sleep(0.5)
 
-        # Emits the event indicating we're finished.
-        self.__emit_status_event('Finished')
+            # Processes all the input files.
+            self.batch_processor.run()
+        finally:
+            if log_file_handler is not None:
+                event_logger.removeHandler(log_file_handler)
+                log_file_handler.close()
 
-    def __move_finished_file(self, in_file_path: Path):
-        new_in_file_path = self.dir_finished_path / in_file_path.name
-        self.__emit_log_event(f'Moving in file {in_file_path} to {new_in_file_path}')
-        in_file_path.rename(new_in_file_path)
 
-    def __write_failed_page(self, page: PageObject) -> None:
-        # Creates the file path.
-        file_path = self.dir_manual_path / f'{time()}.pdf'
+class SearchableThread(QtCore.QThread):
+    '''
+    Makes the pages archived in the deferred mode searchable in the background,
+    while the converter isn't running. Meant to be started with the lowest
+    priority.
+    '''
 
-        # Creates a new pdf writer and adds a page.
-        pdf_writer = PdfWriter()
-        pdf_writer.add_page(page)
+    def __init__(self, dir_temp_path: Path):
+        super().__init__()
 
-        # Writes the output to the file path.
-        with open(file_path, 'wb') as tertiary_file:
-            pdf_writer.write(tertiary_file)
+        # Sets the instance variables, the worker is made by the thread itself so its imports don't hold up the window.
+        self.dir_temp_path = dir_temp_path
+        self.paused = False
 
-    def __write_succeeded_page(self, project_no: str, drawing_no: str, page: PageObject) -> None:
-        # Creates the directory path and the file path.
-        secondary_dir_path = (self.dir_out_path / f'{project_no[0:2]}{"".join("X" for _ in range(len(project_no) - 2))}'
-                              / project_no)
-        tertiary_file_path = secondary_dir_path / f'{project_no}.{drawing_no}.pdf'
+    @staticmethod
+    def __log_event(event: ConverterUpdateEvent | ConverterLogEvent) -> None:
+        logging.info(event.message)
 
-        # Makes the directory and it's parents for the output file.
-        secondary_dir_path.mkdir(parents=True, exist_ok=True)
+    def __idle(self) -> None:
+        # Sleeps in short steps, so a stop request doesn't have to wait for the whole interval.
+        for _ in range(int(SEARCHABLE_IDLE_INTERVAL * 10)):
+            if self.isInterruptionRequested():
+                return
+            self.msleep(100)
 
-        # Creates a new pdf writer and adds a page.
-        pdf_writer = PdfWriter()
-        pdf_writer.add_page(page)
+    def run(self) -> None:
+        from .searchable import SearchableQueue, SearchableWorker, SEARCHABLE_QUEUE_FILE_NAME
 
-        # Writes the pdf to the file at the tertiary file path.
-        with open(tertiary_file_path, 'wb') as tertiary_file:
-            pdf_writer.write(tertiary_file)
+        searchable_worker = SearchableWorker(SearchableQueue(self.dir_temp_path / SEARCHABLE_QUEUE_FILE_NAME))
+        searchable_worker.event_callback = self.__log_event
+        try:
+            while not self.isInterruptionRequested():
+                # Makes one file searchable at a time, so pausing and stopping don't take long.
+                if self.paused or not searchable_worker.run_one():
+                    self.__idle()
+        finally:
+            searchable_worker.queue.close()
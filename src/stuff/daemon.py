@@ -0,0 +1,303 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+from time import sleep, monotonic
+import argparse
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import signal
+import struct
+import sys
+from .events import ConverterUpdateEvent, ConverterLogEvent
+from .options import OcrMode, parse_stage_thread_counts
+from .batch import BatchProcessor
+from .searchable import SearchableQueue, SearchableWorker, SEARCHABLE_QUEUE_FILE_NAME
+from .tesseract import handle_pool, HANDLE_IDLE_TIMEOUT
+
+# The number of seconds the size and modification time of a file must stay the same before it's considered written.
+FILE_SETTLE_TIME = 1.0
+
+# The number of seconds to wait for more files after one is written, so a copied batch is processed at once.
+EVENT_DEBOUNCE_TIME = 0.2
+
+# The number of seconds between two listings of the import folder when inotify isn't available.
+POLL_INTERVAL = 1.0
+
+# The inotify flags, from <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_candidate_file(file_path: Path) -> bool:
+    # Hidden files are the temporary files of most copy tools, they're renamed once complete.
+    return not file_path.name.startswith('.') and file_path.is_file()
+
+
+def file_signature(file_path: Path) -> Optional[tuple[int, int]]:
+    try:
+        stat = file_path.stat()
+    except FileNotFoundError:
+        return None
+
+    return stat.st_size, stat.st_mtime_ns
+
+
+class PollingWatcher(object):
+    '''
+    Finds new files by listing the folder every poll interval, a file is
+    ready once its size and modification time didn't change between two
+    listings. Works on every platform, but adds up to two poll intervals of
+    latency.
+    '''
+
+    def __init__(self, dir_path: Path, poll_interval: float = POLL_INTERVAL):
+        self.dir_path = dir_path
+        self.poll_interval = poll_interval
+        self.signatures: dict[Path, tuple[int, int]] = {}
+
+    def wait(self, timeout: Optional[float] = None) -> list[Path]:
+        # Listing takes a poll interval regardless of the timeout, files can only be ready after two listings.
+        sleep(self.poll_interval)
+
+        # Lists the folder, and keeps the files that look the same as during the previous listing.
+        signatures = {
+            file_path: signature
+            for file_path in self.dir_path.iterdir() if is_candidate_file(file_path)
+            for signature in [file_signature(file_path)] if signature is not None
+        }
+        ready_file_paths = [file_path for file_path, signature in signatures.items()
+                            if self.signatures.get(file_path) == signature]
+        self.signatures = signatures
+
+        return ready_file_paths
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher(object):
+    '''
+    Gets notified by the kernel when a file in the folder is closed after
+    writing, or moved into it. Only available on Linux.
+    '''
+
+    def __init__(self, dir_path: Path, debounce_time: float = EVENT_DEBOUNCE_TIME):
+        self.dir_path = dir_path
+        self.debounce_time = debounce_time
+
+        # Sets up the inotify instance through libc, so no extra package is needed.
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch failed for {dir_path}')
+
+    @staticmethod
+    def is_available() -> bool:
+        return sys.platform.startswith('linux')
+
+    def __read_file_paths(self) -> set[Path]:
+        file_paths: set[Path] = set()
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return file_paths
+
+            # Parses the events, each header is followed by the (null padded) name of the file.
+            offset = 0
+            while offset < len(buffer):
+                (_, mask, _, name_length) = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+                offset += INOTIFY_EVENT_HEADER.size
+                name = buffer[offset:offset + name_length].rstrip(b'\0')
+                offset += name_length
+                if mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and len(name) != 0:
+                    file_paths.add(self.dir_path / os.fsdecode(name))
+
+    def wait(self, timeout: Optional[float] = None) -> list[Path]:
+        # Blocks until something is written (or the timeout passes), and then collects the files written shortly after.
+        if len(select.select([self.fd], [], [], timeout)[0]) == 0:
+            return []
+        file_paths = self.__read_file_paths()
+        while len(select.select([self.fd], [], [], self.debounce_time)[0]) != 0:
+            file_paths |= self.__read_file_paths()
+
+        return sorted(file_path for file_path in file_paths if is_candidate_file(file_path))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class HotFolderDaemon(object):
+    '''
+    Processes the files in the import folder as soon as they're written,
+    using the same batch processor as the GUI but without loading Qt.
+    '''
+
+    def __init__(self, dir_in_path: Path, dir_out_path: Path, dir_manual_path: Path, dir_temp_path: Path,
+                 dir_finished_path: Path, worker_count: int = 1, ocr_mode: OcrMode = OcrMode.FULL,
+                 cache_path: Optional[Path] = None, use_text_layer: bool = True,
+                 profiles_path: Optional[Path] = None, report_path: Optional[Path] = None,
+                 temp_max_bytes: Optional[int] = None, stage_thread_counts: Optional[dict[str, int]] = None):
+        self.dir_in_path = dir_in_path
+        self.dir_out_path = dir_out_path
+        self.dir_manual_path = dir_manual_path
+        self.dir_temp_path = dir_temp_path
+        self.dir_finished_path = dir_finished_path
+        self.worker_count = worker_count
+        self.ocr_mode = ocr_mode
+        self.cache_path = cache_path
+        self.use_text_layer = use_text_layer
+        self.profiles_path = profiles_path
+        self.report_path = report_path
+        self.temp_max_bytes = temp_max_bytes
+        self.stage_thread_counts = stage_thread_counts
+
+        # The files that failed, by the signature they had, they're only retried once they're written again.
+        self.failed_signatures: dict[Path, tuple[int, int]] = {}
+
+    @staticmethod
+    def __log_event(event: ConverterUpdateEvent | ConverterLogEvent) -> None:
+        if isinstance(event, ConverterUpdateEvent):
+            logging.info(f'[{event.progress:3d}%] {event.message}')
+        else:
+            logging.info(event.message)
+
+    def __list_settled_file_paths(self) -> list[Path]:
+        # Lists the folder twice, the files still being written at startup are picked up once they're closed.
+        signatures = {file_path: file_signature(file_path)
+                      for file_path in self.dir_in_path.iterdir() if is_candidate_file(file_path)}
+        if len(signatures) == 0:
+            return []
+
+        sleep(FILE_SETTLE_TIME)
+        return sorted(file_path for file_path, signature in signatures.items()
+                      if signature is not None and file_signature(file_path) == signature)
+
+    def __remember_failed_files(self, in_file_paths: list[Path]) -> None:
+        for in_file_path in in_file_paths:
+            signature = file_signature(in_file_path)
+            if signature is not None:
+                self.failed_signatures[in_file_path] = signature
+
+    def process(self, in_file_paths: list[Path]) -> None:
+        # Skips the files that are gone already or failed before without being changed since.
+        in_file_paths = [
+            in_file_path for in_file_path in in_file_paths
+            for signature in [file_signature(in_file_path)]
+            if signature is not None and self.failed_signatures.get(in_file_path) != signature
+        ]
+        if len(in_file_paths) == 0:
+            return
+
+        logging.info(f'Processing {len(in_file_paths)} new files')
+        start_time = monotonic()
+
+        batch_processor = BatchProcessor.build(self.dir_in_path, self.dir_out_path, self.dir_manual_path,
+                                               self.dir_temp_path, self.dir_finished_path, self.worker_count,
+                                               self.ocr_mode, self.cache_path, self.use_text_layer,
+                                               self.profiles_path, in_file_paths, self.report_path,
+                                               self.temp_max_bytes, self.stage_thread_counts)
+        batch_processor.event_callback = self.__log_event
+        try:
+            batch_processor.run()
+        except Exception:
+            # Remembers the files that weren't moved away, so they aren't retried in a loop.
+            logging.exception('Failed to process the new files')
+            self.__remember_failed_files(in_file_paths)
+            return
+
+        # Remembers the files that failed on their own, the others are moved away already.
+        self.__remember_failed_files(batch_processor.failed_file_paths)
+
+        logging.info(f'Processed {len(in_file_paths) - len(batch_processor.failed_file_paths)} files in '
+                     f'{monotonic() - start_time:.2f}s')
+
+    def run(self, once: bool = False) -> None:
+        self.dir_in_path.mkdir(parents=True, exist_ok=True)
+
+        # Starts watching before the initial listing, so no file written in between is missed.
+        watcher: Optional[InotifyWatcher | PollingWatcher] = None
+        if not once:
+            if InotifyWatcher.is_available():
+                watcher = InotifyWatcher(self.dir_in_path)
+            else:
+                watcher = PollingWatcher(self.dir_in_path)
+            logging.info(f'Watching {self.dir_in_path} using {type(watcher).__name__}')
+
+        # Makes the pages archived in the deferred mode searchable, while no new files arrive.
+        searchable_worker = SearchableWorker(SearchableQueue(self.dir_temp_path / SEARCHABLE_QUEUE_FILE_NAME))
+        searchable_worker.event_callback = self.__log_event
+
+        try:
+            # Processes the files that were already there.
+            self.process(self.__list_settled_file_paths())
+
+            searchable_pending = True
+            while watcher is not None:
+                # Only checks for new files while there are files to make searchable, otherwise waits for them. The
+                #  wait is cut short once in a while, to clean up the Tesseract handles nothing used in the meantime.
+                in_file_paths = watcher.wait(0.0 if searchable_pending else HANDLE_IDLE_TIMEOUT)
+                if len(in_file_paths) != 0:
+                    self.process(in_file_paths)
+                    searchable_pending = True
+                    continue
+
+                # Nothing new arrived, so makes one archived file searchable in the meantime.
+                searchable_pending = searchable_worker.run_one()
+                if not searchable_pending:
+                    handle_pool.cleanup_idle()
+        finally:
+            # The Tesseract handles live as long as the daemon, they're shared by all the batches.
+            handle_pool.close()
+            searchable_worker.queue.close()
+            if watcher is not None:
+                watcher.close()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    default_drawings_path = Path.home() / 'Werktekeningen'
+
+    parser = argparse.ArgumentParser(description='Process the drawings in the import folder as soon as they arrive.')
+    parser.add_argument('--in', dest='in_dir', type=Path, default=default_drawings_path / 'Import')
+    parser.add_argument('--out', dest='out_dir', type=Path, default=default_drawings_path / 'Archief')
+    parser.add_argument('--manual', dest='manual_dir', type=Path, default=default_drawings_path / 'Handmatig')
+    parser.add_argument('--finished', dest='finished_dir', type=Path, default=default_drawings_path / 'Verwerkt')
+    parser.add_argument('--temp', dest='temp_dir', type=Path, default=default_drawings_path / 'Temp')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--ocr-mode', choices=[mode.value for mode in OcrMode], default=OcrMode.FULL.value)
+    parser.add_argument('--cache', type=Path, default=None, help='path of the result cache')
+    parser.add_argument('--profiles', type=Path, default=None, help='path of the detection profiles')
+    parser.add_argument('--report', type=Path, default=None, help='path of the JSON lines file the run reports go to')
+    parser.add_argument('--temp-max-mb', type=int, default=None, help='size of the temp directory to stay below')
+    parser.add_argument('--threads', type=parse_stage_thread_counts, default=None,
+                        help='threads per stage of the page pipeline, like rasterize=2,orientation=4,recognize=2')
+    parser.add_argument('--no-text-layer', action='store_true', help='always use OCR, even if a page has text')
+    parser.add_argument('--once', action='store_true', help='process the files present and exit')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    # Stops cleanly when the service is stopped.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    daemon = HotFolderDaemon(args.in_dir, args.out_dir, args.manual_dir, args.temp_dir, args.finished_dir,
+                             args.workers, OcrMode(args.ocr_mode), args.cache, not args.no_text_layer, args.profiles,
+                             args.report, args.temp_max_mb * 1024 * 1024 if args.temp_max_mb is not None else None,
+                             args.threads)
+    try:
+        daemon.run(args.once)
+    except KeyboardInterrupt:
+        pass
+
+    return 0
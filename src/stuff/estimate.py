@@ -0,0 +1,118 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+from PyPDF2 import PdfReader
+from time import perf_counter
+from .raster import rasterize_dpi
+
+# The cost of a page is the number of pixels it's rasterized to, relative to an A4 sheet, plus a fixed part for
+#  the work that doesn't depend on the size (starting pdftoppm, the title detection and the writing).
+REFERENCE_PAGE_PIXELS = (842.0 * 200.0 / 72.0) * (595.0 * 200.0 / 72.0)
+PAGE_FIXED_COST = 0.25
+
+# The cost of a page of which the size can't be read, and of a file that can't be read at all.
+UNKNOWN_PAGE_COST = 1.0 + PAGE_FIXED_COST
+
+
+def page_cost(page_width: float, page_height: float) -> float:
+    dpi = rasterize_dpi(page_width, page_height)
+    pixels = (page_width * dpi / 72.0) * (page_height * dpi / 72.0)
+    return pixels / REFERENCE_PAGE_PIXELS + PAGE_FIXED_COST
+
+
+class FileEstimate(object):
+    '''
+    The estimated cost of each page of a file, in A4 pages.
+    '''
+
+    def __init__(self, page_costs: list[float]) -> None:
+        self.page_costs = page_costs
+
+    def cost(self) -> float:
+        return sum(self.page_costs)
+
+    @staticmethod
+    def read(file_path: Path) -> FileEstimate:
+        '''
+        Estimate the cost of a file from the number and size of its pages,
+        only the page tree is read, none of the contents.
+        '''
+        try:
+            with file_path.open('rb') as file:
+                page_costs = []
+                for page in PdfReader(file).pages:
+                    try:
+                        page_costs.append(page_cost(float(page.mediabox.width), float(page.mediabox.height)))
+                    except (KeyError, TypeError, ValueError):
+                        page_costs.append(UNKNOWN_PAGE_COST)
+        except Exception:
+            # The file will fail while processing as well, it's reported there.
+            return FileEstimate([UNKNOWN_PAGE_COST])
+
+        return FileEstimate(page_costs)
+
+
+class ProgressTracker(object):
+    '''
+    Keeps track of the progress of a batch by the estimated cost of the pages
+    that are done, and learns the rate at which pages are processed from it
+    to estimate the remaining time.
+    '''
+
+    def __init__(self, file_estimates: list[FileEstimate]) -> None:
+        self.file_estimates = file_estimates
+        self.total_cost = sum(file_estimate.cost() for file_estimate in file_estimates)
+        self.total_page_count = sum(len(file_estimate.page_costs) for file_estimate in file_estimates)
+
+        # Sets the state instance variables.
+        self.done_page_indices: dict[int, set[int]] = {}
+        self.finished_file_indices: set[int] = set()
+        self.done_cost = 0.0
+        self.done_page_count = 0
+        self.start_time = perf_counter()
+
+    def page_done(self, file_index: int, page_index: int) -> None:
+        done_page_indices = self.done_page_indices.setdefault(file_index, set())
+        if file_index in self.finished_file_indices or page_index in done_page_indices:
+            return
+
+        page_costs = self.file_estimates[file_index].page_costs
+        done_page_indices.add(page_index)
+        self.done_cost += page_costs[page_index] if page_index < len(page_costs) else 0.0
+        self.done_page_count += 1
+
+    def file_done(self, file_index: int) -> None:
+        # Counts the pages that weren't reported as well, like the ones written by an earlier run.
+        if file_index in self.finished_file_indices:
+            return
+
+        done_page_indices = self.done_page_indices.pop(file_index, set())
+        for page_index, cost in enumerate(self.file_estimates[file_index].page_costs):
+            if page_index not in done_page_indices:
+                self.done_cost += cost
+                self.done_page_count += 1
+        self.finished_file_indices.add(file_index)
+
+    def progress(self) -> int:
+        # Stays below 100 until all files are finished, that means the batch is done.
+        if len(self.finished_file_indices) == len(self.file_estimates):
+            return 100
+        if self.total_cost == 0.0:
+            return 0
+
+        return min(99, int(self.done_cost / self.total_cost * 100.0))
+
+    def pages_per_second(self) -> Optional[float]:
+        elapsed_seconds = perf_counter() - self.start_time
+        if self.done_page_count == 0 or elapsed_seconds <= 0.0:
+            return None
+
+        return self.done_page_count / elapsed_seconds
+
+    def eta_seconds(self) -> Optional[float]:
+        # Assumes the remaining work goes at the same rate as the work done so far.
+        elapsed_seconds = perf_counter() - self.start_time
+        if self.done_cost == 0.0 or elapsed_seconds <= 0.0:
+            return None
+
+        return max(0.0, self.total_cost - self.done_cost) / (self.done_cost / elapsed_seconds)
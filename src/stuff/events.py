@@ -0,0 +1,36 @@
+from typing import Optional
+
+
+class ConverterUpdateEvent:
+    def __init__(self, progress: int, message: str, pages_per_second: Optional[float] = None,
+                 eta_seconds: Optional[float] = None) -> None:
+        self.progress = progress
+        self.message = message
+        self.pages_per_second = pages_per_second
+        self.eta_seconds = eta_seconds
+
+    def __str__(self):
+        return f'{self.progress}: {self.message}'
+
+
+class ConverterLogEvent:
+    def __init__(self, t: float, message: str) -> None:
+        self.t = t
+        self.message = message
+
+    def __str__(self):
+        return f'{self.t}: {self.message}'
+
+
+class ConverterPageEvent:
+    '''
+    Emitted once the work on a page is done, the batch processor keeps track
+    of the progress with it.
+    '''
+
+    def __init__(self, file_index: int, page_index: int) -> None:
+        self.file_index = file_index
+        self.page_index = page_index
+
+    def __str__(self):
+        return f'{self.file_index}: page {self.page_index} done'
@@ -0,0 +1,106 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+from time import time
+import json
+import sqlite3
+from .store import SqliteStore
+
+# The name of the journal in the temp directory, next to the intermediates it refers to.
+JOURNAL_FILE_NAME = '.journal.sqlite3'
+
+
+class Intermediate(object):
+    '''
+    A temp file with the OCR'ed pages of an input file, together with the
+    indices of the pages in the input file and their detected angles.
+    '''
+
+    def __init__(self, temp_file_path: Path, page_indices: list[int], page_angles: dict[int, int]) -> None:
+        self.temp_file_path = temp_file_path
+        self.page_indices = page_indices
+        self.page_angles = page_angles
+
+
+class BatchJournal(SqliteStore):
+    '''
+    Write-ahead journal of the progress on the input files: which pages are
+    written to their output file and which intermediates are complete. Each
+    step is committed as soon as it's done, so after a crash the files are
+    picked up where they were left.
+    '''
+
+    @staticmethod
+    def file_key(in_file_path: Path) -> str:
+        # Identifies an input file by its name, size and modification time, a changed file starts over.
+        stat = in_file_path.stat()
+        return f'{in_file_path.name}:{stat.st_size}:{stat.st_mtime_ns}'
+
+    def create_schema(self, connection: sqlite3.Connection) -> None:
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS intermediates (file_key TEXT PRIMARY KEY, temp_file_path TEXT NOT NULL, '
+            'page_indices TEXT NOT NULL, page_angles TEXT NOT NULL, created REAL NOT NULL)')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS written_pages (file_key TEXT NOT NULL, page_index INTEGER NOT NULL, '
+            'output_path TEXT NOT NULL, written REAL NOT NULL, PRIMARY KEY (file_key, page_index))')
+
+    def get_written_page_indices(self, file_key: str) -> set[int]:
+        rows = self.connect().execute('SELECT page_index FROM written_pages WHERE file_key = ?',
+                                      (file_key,)).fetchall()
+        return {row[0] for row in rows}
+
+    def put_written_pages(self, file_key: str, page_indices: list[int], output_path: Path) -> None:
+        connection = self.connect()
+        connection.executemany('INSERT OR REPLACE INTO written_pages VALUES (?, ?, ?, ?)',
+                               [(file_key, page_index, str(output_path), time()) for page_index in page_indices])
+        connection.commit()
+
+    def get_intermediate(self, file_key: str) -> Optional[Intermediate]:
+        row = self.connect().execute(
+            'SELECT temp_file_path, page_indices, page_angles FROM intermediates WHERE file_key = ?',
+            (file_key,)).fetchone()
+        if row is None:
+            return None
+
+        page_angles = {int(page_index): angle for page_index, angle in json.loads(row[2]).items()}
+        return Intermediate(Path(row[0]), json.loads(row[1]), page_angles)
+
+    def put_intermediate(self, file_key: str, intermediate: Intermediate) -> None:
+        replaced_intermediate = self.get_intermediate(file_key)
+        connection = self.connect()
+        connection.execute('INSERT OR REPLACE INTO intermediates VALUES (?, ?, ?, ?, ?)',
+                           (file_key, str(intermediate.temp_file_path), json.dumps(intermediate.page_indices),
+                            json.dumps(intermediate.page_angles), time()))
+        connection.commit()
+
+        # Unlinks the temp file of the intermediate this one replaces, nothing refers to it anymore.
+        if replaced_intermediate is not None and replaced_intermediate.temp_file_path != intermediate.temp_file_path:
+            replaced_intermediate.temp_file_path.unlink(missing_ok=True)
+
+    def intermediate_file_paths(self) -> set[Path]:
+        rows = self.connect().execute('SELECT temp_file_path FROM intermediates').fetchall()
+        return {Path(row[0]) for row in rows}
+
+    def drop_intermediates(self, kept_file_keys: set[str], created_before: float) -> None:
+        '''
+        Drop the intermediates created before the given time, except the ones
+        of the given files, and unlink their temp files. These are of files
+        which changed or are gone, so they can't be resumed from anymore.
+        '''
+        connection = self.connect()
+        rows = connection.execute('SELECT file_key, temp_file_path FROM intermediates WHERE created < ?',
+                                  (created_before,)).fetchall()
+        dropped_rows = [row for row in rows if row[0] not in kept_file_keys]
+        connection.executemany('DELETE FROM intermediates WHERE file_key = ?', [(row[0],) for row in dropped_rows])
+        connection.commit()
+
+        for (_, temp_file_path) in dropped_rows:
+            Path(temp_file_path).unlink(missing_ok=True)
+
+    def finish_file(self, file_key: str) -> None:
+        # The file is moved out of the input directory, so nothing of it is needed anymore.
+        connection = self.connect()
+        connection.execute('DELETE FROM intermediates WHERE file_key = ?', (file_key,))
+        connection.execute('DELETE FROM written_pages WHERE file_key = ?', (file_key,))
+        connection.commit()
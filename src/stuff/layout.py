@@ -0,0 +1,141 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterator, Optional
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTTextContainer
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+
+# The distance (in points) the region analyzed around the title reaches beyond the detection tolerance, so the
+#  text boxes near the title are grouped the same as on the whole page.
+LAYOUT_REGION_MARGIN = 150.0
+
+# The distance (in points) from the edge of the region within which a text box is considered cut off by it.
+LAYOUT_REGION_EDGE = 1.0
+
+# The position (in points) far off the page, the characters outside of the region are moved to.
+LAYOUT_GAP_POSITION = -1.0e6
+
+
+def boxes_overlap(a: tuple[float, float, float, float], b: tuple[float, float, float, float]) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class RegionPageAggregator(PDFPageAggregator):
+    '''
+    Page aggregator which only keeps the characters in a region, so the layout
+    analysis only has to group those. The characters around the ones left out
+    stay apart, like on the whole page. The graphics are dropped altogether,
+    the pages are only routed on their text.
+    '''
+
+    def __init__(self, resource_manager: PDFResourceManager, laparams: LAParams,
+                 region: Optional[tuple[float, float, float, float]]) -> None:
+        super().__init__(resource_manager, laparams=laparams)
+        self.region = region
+        self.skipped_char_count = 0
+
+    def render_char(self, *args, **kwargs) -> float:
+        advance = super().render_char(*args, **kwargs)
+
+        # Moves the character that was just added far off the page if it's outside the region. Lines are made of
+        #  characters drawn one after the other, so the characters on either side of the skipped ones may not end
+        #  up next to each other. One such character is kept per run of skipped ones, the others are taken off.
+        if self.region is not None:
+            objs = self.cur_item._objs
+            char = objs[-1]
+            if not boxes_overlap(char.bbox, self.region):
+                if len(objs) >= 2 and objs[-2].x0 == LAYOUT_GAP_POSITION:
+                    objs.pop()
+                else:
+                    char.set_bbox((LAYOUT_GAP_POSITION, LAYOUT_GAP_POSITION, LAYOUT_GAP_POSITION + char.width,
+                                   LAYOUT_GAP_POSITION + char.height))
+                self.skipped_char_count += 1
+
+        return advance
+
+    def paint_path(self, *args, **kwargs) -> None:
+        pass
+
+    def render_image(self, *args, **kwargs) -> None:
+        pass
+
+
+class PageLayout(object):
+    '''
+    The text layout of a page, analyzed lazily: a lookup near a point only
+    analyzes the text in a region around it, the rest of the page is only
+    analyzed when a text box in the region might continue outside of it.
+    '''
+
+    def __init__(self, page: PDFPage, resource_manager: PDFResourceManager, laparams: LAParams) -> None:
+        self.page = page
+        self.resource_manager = resource_manager
+        self.laparams = laparams
+        self.page_text_elements: Optional[list[LTTextContainer]] = None
+
+        # The size of the page like pdfminer's layout has it, with the rotation of the page applied.
+        (x0, y0, x1, y1) = page.mediabox
+        (self.width, self.height) = (abs(x1 - x0), abs(y1 - y0))
+        if page.rotate % 180 == 90:
+            (self.width, self.height) = (self.height, self.width)
+
+    def __analyze(self, region: Optional[tuple[float, float, float, float]]) -> tuple[list[LTTextContainer], int]:
+        device = RegionPageAggregator(self.resource_manager, self.laparams, region)
+        PDFPageInterpreter(self.resource_manager, device).process_page(self.page)
+        text_elements = [e for e in device.get_result()
+                         if isinstance(e, LTTextContainer) and e.x0 != LAYOUT_GAP_POSITION]
+        return text_elements, device.skipped_char_count
+
+    def text_elements(self) -> list[LTTextContainer]:
+        '''
+        Get the text elements of the whole page.
+        '''
+        if self.page_text_elements is None:
+            (self.page_text_elements, _) = self.__analyze(None)
+
+        return self.page_text_elements
+
+    def text_elements_near(self, x: float, y: float, r: float) -> list[LTTextContainer]:
+        '''
+        Get the text elements to look for the ones within distance r of (x, y)
+        in. These are the same ones as on the whole page near the point, but
+        usually only a small part of the page is analyzed for them.
+        '''
+        if self.page_text_elements is not None:
+            return self.page_text_elements
+
+        margin = r + LAYOUT_REGION_MARGIN
+        region = (x - margin, y - margin, x + margin, y + margin)
+        (text_elements, skipped_char_count) = self.__analyze(region)
+
+        # Without any text outside of the region, the region is the whole page.
+        if skipped_char_count == 0:
+            self.page_text_elements = text_elements
+            return text_elements
+
+        # Analyzes the whole page after all if a text box near the point reaches the edge of the region, it
+        #  might have been grouped differently with the text outside of it.
+        near_box = (x - 2.0 * r, y - 2.0 * r, x + 2.0 * r, y + 2.0 * r)
+        inner_region = (region[0] + LAYOUT_REGION_EDGE, region[1] + LAYOUT_REGION_EDGE,
+                        region[2] - LAYOUT_REGION_EDGE, region[3] - LAYOUT_REGION_EDGE)
+        for text_element in text_elements:
+            if boxes_overlap(text_element.bbox, near_box) and not (
+                    inner_region[0] < text_element.x0 and text_element.x1 < inner_region[2] and
+                    inner_region[1] < text_element.y0 and text_element.y1 < inner_region[3]):
+                return self.text_elements()
+
+        return text_elements
+
+
+def iterate_page_layouts(path: Path, page_indices: Optional[list[int]] = None) -> Iterator[PageLayout]:
+    '''
+    Iterate over the lazy layouts of the pages with the given indices, or all
+    pages. The layouts can only be used while iterating, the file is closed
+    after.
+    '''
+    laparams = LAParams()
+    with path.open('rb') as file:
+        resource_manager = PDFResourceManager(caching=True)
+        for page in PDFPage.get_pages(file, page_indices):
+            yield PageLayout(page, resource_manager, laparams)
@@ -0,0 +1,32 @@
+from __future__ import annotations
+from enum import Enum
+
+# The number of threads of each stage of the page pipeline, pdftoppm and Tesseract release the GIL so they
+#  really run at the same time. Can be overridden per stage.
+STAGE_THREAD_COUNTS = {'rasterize': 2, 'orientation': 4, 'recognize': 2}
+
+
+class OcrMode(Enum):
+    # OCR's the full pages and archives the searchable pages.
+    FULL = 'full'
+    # Only OCR's the title block and archives the original pages.
+    TITLE_BLOCK = 'title_block'
+    # OCR's the full pages in memory, without writing a temp file, and archives the original pages.
+    SINGLE_PASS = 'single_pass'
+    # Only OCR's the title block and archives the original pages, which are made searchable later on.
+    DEFERRED = 'deferred'
+
+
+def parse_stage_thread_counts(text: str) -> dict[str, int]:
+    '''
+    Parse stage thread counts like 'rasterize=2,orientation=4', the stages
+    that aren't mentioned keep their default.
+    '''
+    stage_thread_counts = {}
+    for part in filter(None, (part.strip() for part in text.split(','))):
+        (stage, _, thread_count) = part.partition('=')
+        if stage not in STAGE_THREAD_COUNTS or not thread_count.isdigit() or int(thread_count) < 1:
+            raise ValueError(f'Invalid stage thread count {part!r}, stages are {", ".join(STAGE_THREAD_COUNTS)}')
+        stage_thread_counts[stage] = int(thread_count)
+
+    return stage_thread_counts
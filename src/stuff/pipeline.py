@@ -0,0 +1,148 @@
+from __future__ import annotations
+from typing import Any, Callable, Generator, Iterable, Optional
+import queue
+import threading
+
+# The number of items waiting between two stages, the stages in front of a full queue wait.
+PIPELINE_QUEUE_SIZE = 2
+
+# The number of seconds between two checks of whether the pipeline is stopped, while waiting on a queue.
+PIPELINE_POLL_INTERVAL = 0.1
+
+# Marks the end of the items in a queue.
+_END = object()
+
+
+class PipelineStage(object):
+    '''
+    A step of a pipeline, the function is called on each item by the given
+    number of threads at once and returns the item for the next stage.
+    '''
+
+    def __init__(self, name: str, function: Callable[[Any], Any], thread_count: int = 1) -> None:
+        self.name = name
+        self.function = function
+        self.thread_count = max(1, thread_count)
+
+
+class Pipeline(object):
+    '''
+    Runs items through stages which work concurrently, connected by bounded
+    queues, so an item moves on as soon as it's done while the next ones
+    are still being worked on. The results come out in the order of the
+    items, and at most max_in_flight items are in between, which bounds the
+    memory usage no matter how many items there are.
+    '''
+
+    def __init__(self, stages: list[PipelineStage], queue_size: int = PIPELINE_QUEUE_SIZE,
+                 max_in_flight: Optional[int] = None) -> None:
+        self.stages = stages
+        self.queue_size = queue_size
+        self.max_in_flight = max_in_flight if max_in_flight is not None else (
+                sum(stage.thread_count for stage in stages) + queue_size * (len(stages) + 1))
+
+    def run(self, items: Iterable) -> Generator[Any, None, None]:
+        '''
+        Run the items through the stages, and yield the results in order. The
+        first error of any stage stops the pipeline and is raised here.
+        '''
+        queues: list[queue.Queue] = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        in_flight = threading.Semaphore(self.max_in_flight)
+        stopped = threading.Event()
+        errors: list[BaseException] = []
+        finished_lock = threading.Lock()
+        finished_thread_counts = [0 for _ in self.stages]
+
+        def put(stage_queue: queue.Queue, value: Any) -> bool:
+            # Waits for room in the queue, unless the pipeline is stopped.
+            while not stopped.is_set():
+                try:
+                    stage_queue.put(value, timeout=PIPELINE_POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(stage_queue: queue.Queue) -> Any:
+            # Waits for an item in the queue, unless the pipeline is stopped.
+            while not stopped.is_set():
+                try:
+                    return stage_queue.get(timeout=PIPELINE_POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+            return _END
+
+        def fail(error: BaseException) -> None:
+            errors.append(error)
+            stopped.set()
+
+        def feed() -> None:
+            try:
+                for sequence_nr, item in enumerate(items):
+                    # Holds off new items while too many are in between.
+                    while not in_flight.acquire(timeout=PIPELINE_POLL_INTERVAL):
+                        if stopped.is_set():
+                            return
+                    if not put(queues[0], (sequence_nr, item)):
+                        return
+            except BaseException as e:
+                fail(e)
+            finally:
+                for _ in range(self.stages[0].thread_count):
+                    put(queues[0], _END)
+
+        def work(stage_index: int) -> None:
+            stage = self.stages[stage_index]
+            try:
+                while True:
+                    entry = get(queues[stage_index])
+                    if entry is _END:
+                        break
+
+                    (sequence_nr, item) = entry
+                    if not put(queues[stage_index + 1], (sequence_nr, stage.function(item))):
+                        break
+            except BaseException as e:
+                fail(e)
+            finally:
+                # The last thread of the stage to finish tells each thread of the next stage there's nothing left.
+                with finished_lock:
+                    finished_thread_counts[stage_index] += 1
+                    last_thread = finished_thread_counts[stage_index] == stage.thread_count
+                if last_thread:
+                    next_thread_count = self.stages[stage_index + 1].thread_count if (
+                            stage_index + 1 < len(self.stages)) else 1
+                    for _ in range(next_thread_count):
+                        put(queues[stage_index + 1], _END)
+
+        threads = [threading.Thread(target=feed, name='pipeline-feed', daemon=True)]
+        for stage_index, stage in enumerate(self.stages):
+            threads.extend(threading.Thread(target=work, args=(stage_index,), name=f'pipeline-{stage.name}',
+                                            daemon=True) for _ in range(stage.thread_count))
+        for thread in threads:
+            thread.start()
+
+        try:
+            # Puts the results back in order, the ones that are done early wait for those before them.
+            pending_results = {}
+            next_sequence_nr = 0
+            while True:
+                entry = get(queues[-1])
+                if entry is _END:
+                    break
+
+                (sequence_nr, result) = entry
+                pending_results[sequence_nr] = result
+                while next_sequence_nr in pending_results:
+                    result = pending_results.pop(next_sequence_nr)
+                    next_sequence_nr += 1
+                    in_flight.release()
+                    yield result
+
+            if len(errors) != 0:
+                raise errors[0]
+        finally:
+            # Stops the threads as well when the results aren't all taken.
+            stopped.set()
+            for thread in threads:
+                thread.join()
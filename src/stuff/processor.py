@@ -0,0 +1,681 @@
+from __future__ import annotations
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Callable, Generator, Iterable, Iterator, Optional
+from PIL.Image import Image
+from PyPDF2 import PdfReader, PageObject
+from pyocr import pyocr
+from pdf2image import pdf2image
+from pdfminer.layout import LTTextContainer
+from time import time, perf_counter, sleep
+import uuid
+from .events import ConverterUpdateEvent, ConverterLogEvent, ConverterPageEvent
+from .options import OcrMode, STAGE_THREAD_COUNTS
+from .tesseract import TesseractsPdfBuilder, detect_orientation, recognize_text_lines
+from .cache import ResultCache, CachedResult, hash_page
+from .spatial import TextElementIndex
+from .profiles import DetectionProfile, DetectionProfiles, ProfileStatistics, page_rotation, sheet_rotation
+from .writer import OutputWriter
+from .timing import StageTimings
+from .journal import BatchJournal, Intermediate
+from .raster import rasterize_dpi, image_dpi, rotate_image
+from .searchable import SearchableQueue
+from .pipeline import Pipeline, PipelineStage
+from .layout import PageLayout, iterate_page_layouts
+from .archive import ArchiveIndex, ArchivedDrawing, drawing_file_name
+
+# The size (in points) of the area around the title detection center which is OCR'ed in the title block mode.
+TITLE_BLOCK_CROP_WIDTH = 300
+TITLE_BLOCK_CROP_HEIGHT = 80
+
+# Orientation detection runs on images reduced to about this resolution, only failures are retried at full size.
+OSD_DPI = 67
+
+# The number of pages in the pipeline at once, only these pages are kept in memory.
+PIPELINE_MAX_PAGES = 6
+
+# The number of seconds between two checks of the size of the temp directory while it's too large, and the
+#  number of seconds after which the OCR continues anyway (the earlier file might have failed).
+TEMP_SPACE_POLL_INTERVAL = 0.5
+TEMP_SPACE_MAX_WAIT = 120.0
+
+
+class OcrTextBox(object):
+    '''
+    A line of text recognized by Tesseract, in PDF coordinates. Has the same
+    attributes as the pdfminer text containers so both can be routed the same.
+    '''
+
+    def __init__(self, x0: float, y0: float, x1: float, y1: float, text: str) -> None:
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+        self.text = text
+
+    def get_text(self) -> str:
+        return self.text
+
+
+class FileProcessor(object):
+    '''
+    Performs OCR on a single input file and routes its pages to the output or
+    manual directory. Contains no Qt objects, so it can be pickled and run in
+    a worker process; events are handed to the event callback instead.
+    '''
+
+    def __init__(self, dir_out_path: Path, dir_manual_path: Path, dir_temp_path: Path, dir_finished_path: Path,
+                 file_count: int, ocr_mode: OcrMode = OcrMode.FULL, result_cache: Optional[ResultCache] = None,
+                 use_text_layer: bool = True, detection_profiles: Optional[DetectionProfiles] = None,
+                 journal: Optional[BatchJournal] = None, run_id: str = '', temp_max_bytes: Optional[int] = None,
+                 searchable_queue: Optional[SearchableQueue] = None,
+                 stage_thread_counts: Optional[dict[str, int]] = None,
+                 archive_index: Optional[ArchiveIndex] = None):
+        # Sets the instance variables.
+        self.dir_out_path = dir_out_path
+        self.dir_manual_path = dir_manual_path
+        self.dir_temp_path = dir_temp_path
+        self.dir_finished_path = dir_finished_path
+        self.file_count = file_count
+        self.ocr_mode = ocr_mode
+        self.result_cache = result_cache
+        self.use_text_layer = use_text_layer
+        self.detection_profiles = detection_profiles if detection_profiles is not None else DetectionProfiles([])
+        self.journal = journal
+        self.run_id = run_id
+        self.temp_max_bytes = temp_max_bytes
+        self.searchable_queue = searchable_queue
+        self.stage_thread_counts = {**STAGE_THREAD_COUNTS, **(stage_thread_counts or {})}
+        self.archive_index = archive_index
+
+        # Sets the state instance variables.
+        self.file_index = 0
+        self.in_file_path: Optional[Path] = None
+        self.file_key: Optional[str] = None
+        self.page_hashes: dict[int, str] = {}
+        self.page_angles: dict[int, int] = {}
+        self.page_rotations: dict[int, int] = {}
+        self.page_dpis: dict[int, int] = {}
+        self.text_layer_page_indices: set[int] = set()
+        self.profile_statistics = ProfileStatistics()
+        self.stage_timings = StageTimings()
+        self.output_writer = OutputWriter()
+        # The drawings reserved in the archive index, which are marked written once their file is, by path.
+        self.pending_drawings: dict[Path, ArchivedDrawing] = {}
+        self.event_callback: Optional[Callable[[ConverterUpdateEvent | ConverterLogEvent | ConverterPageEvent],
+                                               None]] = None
+
+    def __getstate__(self) -> dict:
+        # The event callback is bound to the process that created it, so it's not sent along.
+        state = self.__dict__.copy()
+        state['event_callback'] = None
+        return state
+
+    def __emit_event(self, event: ConverterUpdateEvent | ConverterLogEvent | ConverterPageEvent) -> None:
+        if self.event_callback is not None:
+            self.event_callback(event)
+
+    def __emit_log_event(self, message: str) -> None:
+        log_event = ConverterLogEvent(time(), message)
+        self.__emit_event(log_event)
+
+    def __emit_status_event(self, message: str) -> None:
+        progress = int(min([100.0, (float(self.file_index) / float(self.file_count)) * 100.0])) if (
+                self.file_count != 0) else 100
+        status_event = ConverterUpdateEvent(progress, message)
+        self.__emit_event(status_event)
+
+    def __emit_page_event(self, page_index: int) -> None:
+        self.__emit_event(ConverterPageEvent(self.file_index, page_index))
+
+    def process(self, in_file_path: Path, file_index: int) -> tuple[ProfileStatistics, StageTimings]:
+        self.file_index = file_index
+        self.in_file_path = in_file_path
+        self.page_hashes = {}
+        self.page_angles = {}
+        self.page_rotations = {}
+        self.page_dpis = {}
+        self.text_layer_page_indices = set()
+        self.profile_statistics = ProfileStatistics()
+        self.stage_timings = StageTimings()
+        self.pending_drawings = {}
+        start_time = perf_counter()
+
+        # Gets the pages which are written already, by an earlier run that didn't finish.
+        written_page_indices = set()
+        if self.journal is not None:
+            self.file_key = BatchJournal.file_key(in_file_path)
+            written_page_indices = self.journal.get_written_page_indices(self.file_key)
+            if len(written_page_indices) != 0:
+                self.__emit_log_event(f'Resuming file {in_file_path}, skipping the {len(written_page_indices)} '
+                                      f'pages written by an earlier run')
+
+        # Opens the input file, the pages of which the result is cached are routed right away.
+        self.__emit_log_event(f'Reading input file {in_file_path}')
+        with in_file_path.open('rb') as in_file, self.__releasing_pending_drawings():
+            in_file_reader = PdfReader(in_file)
+            page_count = len(in_file_reader.pages)
+            page_indices = [page_index for page_index in range(page_count) if page_index not in written_page_indices]
+
+            # Hashes the pages before any of them is rotated, the hashes identify them in the cache and the archive.
+            if self.result_cache is not None or self.archive_index is not None:
+                with self.stage_timings.measure('hash'):
+                    for page_index in page_indices:
+                        self.page_hashes[page_index] = hash_page(in_file_reader.pages[page_index])
+
+            with self.stage_timings.measure('cache'):
+                page_indices = self.__route_cached_pages(in_file_path, in_file_reader, page_indices)
+
+            # Routes the pages of which the title can be found in the embedded text, without OCR.
+            if self.use_text_layer and len(page_indices) != 0:
+                page_indices = self.__route_text_layer_pages(in_file_path, in_file_reader, page_indices)
+
+            # Chooses the resolution to rasterize the remaining pages at, their rotation is applied while rasterizing.
+            for page_index in page_indices:
+                mediabox = in_file_reader.pages[page_index].mediabox
+                self.page_dpis[page_index] = rasterize_dpi(float(mediabox.width), float(mediabox.height))
+                self.page_rotations[page_index] = page_rotation(in_file_reader.pages[page_index])
+
+            # Performs OCR on the remaining pages.
+            intermediate = None
+            if len(page_indices) != 0:
+                if self.ocr_mode in (OcrMode.TITLE_BLOCK, OcrMode.SINGLE_PASS, OcrMode.DEFERRED):
+                    self.__run_perform_ocr_on_original_pdf(in_file_path, in_file_reader, page_indices)
+                else:
+                    intermediate = self.__get_or_build_intermediate(in_file_path, page_indices)
+                    self.__process_temp_file(intermediate.temp_file_path, intermediate.page_indices, page_indices)
+
+            # Writes the routed pages while the input file is still open.
+            self.__flush_output()
+
+        self.__move_finished_file(in_file_path)
+        if self.journal is not None and self.file_key is not None:
+            self.journal.finish_file(self.file_key)
+
+        # Releases the temp file right away, nothing refers to it anymore.
+        if intermediate is not None:
+            self.__emit_log_event(f'Unlinking temp file {intermediate.temp_file_path}')
+            intermediate.temp_file_path.unlink(missing_ok=True)
+
+        self.stage_timings.record_file(in_file_path, page_count, perf_counter() - start_time)
+        return self.profile_statistics, self.stage_timings
+
+    @contextmanager
+    def __releasing_pending_drawings(self) -> Iterator[None]:
+        # Releases the revisions reserved for pages that weren't written, when processing the file fails.
+        try:
+            yield
+        finally:
+            if self.archive_index is not None:
+                for drawing in self.pending_drawings.values():
+                    self.archive_index.release(drawing)
+            self.pending_drawings = {}
+
+    def __route_cached_pages(self, in_file_path: Path, in_file_reader: PdfReader,
+                             page_indices: list[int]) -> list[int]:
+        if self.result_cache is None:
+            return page_indices
+
+        remaining_page_indices = []
+        for page_index in page_indices:
+            page = in_file_reader.pages[page_index]
+            # Misses cached by an earlier version are ignored, a later run might find the title after all.
+            cached_result = self.result_cache.get(self.page_hashes[page_index])
+            if cached_result is None or cached_result.project_nr is None or cached_result.drawing_nr is None:
+                remaining_page_indices.append(page_index)
+                continue
+
+            # Routes the original page, rotated like it would have been after orientation detection.
+            self.__emit_status_event(f'Using cached result for page {page_index} from file {in_file_path}')
+            self.__emit_log_event(
+                f'Found cached result for page {page_index}, angle {cached_result.angle}, project number '
+                f'{cached_result.project_nr} and drawing number {cached_result.drawing_nr}')
+            if cached_result.angle % 360 != 0:
+                page.rotate((360 - cached_result.angle) % 360)
+            self.__write_succeeded_page(cached_result.project_nr, cached_result.drawing_nr, page, page_index)
+            self.__emit_page_event(page_index)
+
+        return remaining_page_indices
+
+    def __route_text_layer_pages(self, in_file_path: Path, in_file_reader: PdfReader,
+                                 page_indices: list[int]) -> list[int]:
+        self.__emit_status_event(f'Looking for the title in the text layer of file {in_file_path}')
+        self.__emit_log_event(f'Looking for the title in the text layer of file {in_file_path}')
+
+        remaining_page_indices = []
+        for page_index, page_layout in zip(page_indices, iterate_page_layouts(in_file_path, page_indices)):
+            # Looks for the title in the same way as on an OCR'ed page, only the text near it is analyzed. The page is
+            #  taken to be upright with its rotation applied, like the layout has it.
+            detection_profile = self.detection_profiles.match(
+                page_layout.width, page_layout.height,
+                sheet_rotation(page_rotation(in_file_reader.pages[page_index]), 0))
+            with self.stage_timings.measure('text_layer'):
+                text_elements = page_layout.text_elements_near(detection_profile.center_x,
+                                                               detection_profile.center_y, detection_profile.tolerance)
+            self.__emit_log_event(f'Found {len(text_elements)} text elements in the text layer of page {page_index}')
+            (project_nr, drawing_nr) = self.__find_title(page_index, text_elements, detection_profile)
+            if project_nr is None or drawing_nr is None:
+                remaining_page_indices.append(page_index)
+                continue
+
+            # The page has real text already, so the original page is archived as is.
+            self.text_layer_page_indices.add(page_index)
+            self.__write_succeeded_page(project_nr, drawing_nr, in_file_reader.pages[page_index], page_index)
+            self.__cache_result(page_index, project_nr, drawing_nr)
+            self.__emit_page_event(page_index)
+
+        self.__emit_log_event(f'Found the title in the text layer of {len(page_indices) - len(remaining_page_indices)} '
+                              f'pages, {len(remaining_page_indices)} pages remain for OCR')
+        return remaining_page_indices
+
+    def __cache_result(self, page_index: int, project_nr: Optional[str], drawing_nr: Optional[str]) -> None:
+        # Only caches the pages of which the title was found. A miss depends on the OCR mode and the detection
+        #  profiles, so the page is looked at again the next time it's dropped.
+        if self.result_cache is None or page_index not in self.page_hashes or project_nr is None or (
+                drawing_nr is None):
+            return
+
+        self.result_cache.put(self.page_hashes[page_index],
+                              CachedResult(self.page_angles.get(page_index, 0), project_nr, drawing_nr))
+
+    def __detect_orientation(self, pdf_image: Image) -> tuple[Optional[int], bool]:
+        with self.stage_timings.measure('orientation'):
+            # Detects the orientation on a small grayscale copy first, that's plenty for OSD.
+            reduce_factor = max(1, int(round(image_dpi(pdf_image) / OSD_DPI)))
+            reduced_pdf_image = pdf_image.convert('L').reduce(reduce_factor)
+            reduced_pdf_image.info['dpi'] = (image_dpi(pdf_image) / reduce_factor,) * 2
+            try:
+                return detect_orientation(reduced_pdf_image), False
+            except pyocr.libtesseract.TesseractError:
+                pass
+
+            # Only if that fails the full resolution image is used.
+            try:
+                return detect_orientation(pdf_image), True
+            except pyocr.libtesseract.TesseractError:
+                return None, True
+
+    def __build_pipeline(self, in_file_path: Path, recognize: bool) -> Pipeline:
+        # Each page is rasterized, oriented and (without temp file) recognized by a stage of its own, so a page is
+        #  oriented while the next one is rasterized and the one before it is recognized.
+        stages = [
+            PipelineStage('rasterize', lambda page_index: self.__rasterize_page(in_file_path, page_index),
+                          self.stage_thread_counts['rasterize']),
+            PipelineStage('orientation', lambda page: self.__orient_page(in_file_path, page),
+                          self.stage_thread_counts['orientation']),
+        ]
+        if recognize:
+            stages.append(PipelineStage('recognize', lambda page: self.__recognize_page(in_file_path, page),
+                                        self.stage_thread_counts['recognize']))
+
+        return Pipeline(stages, max_in_flight=PIPELINE_MAX_PAGES)
+
+    def __rasterize_page(self, in_file_path: Path, page_index: int) -> tuple[int, Image]:
+        dpi = self.page_dpis[page_index]
+        self.__emit_log_event(f'Obtaining image of page {page_index} from PDF file {in_file_path} at {dpi} dpi')
+
+        # Renders an uncompressed image, JPEG artifacts hurt the OCR. It's grayscale unless the image itself is
+        #  archived, like in the full mode, the other modes archive the original page.
+        with self.stage_timings.measure('rasterize'):
+            (pdf_image,) = pdf2image.convert_from_path(in_file_path, dpi=dpi, fmt='ppm',
+                                                       grayscale=self.ocr_mode != OcrMode.FULL,
+                                                       first_page=page_index + 1, last_page=page_index + 1)
+        pdf_image.info['dpi'] = (dpi, dpi)
+        return page_index, pdf_image
+
+    def __orient_page(self, in_file_path: Path, page: tuple[int, Image]) -> tuple[int, Image, int]:
+        (pdf_image_index, pdf_image) = page
+        self.__emit_status_event(f'Detecting orientation of page {pdf_image_index} from file {in_file_path}')
+
+        (angle, retried) = self.__detect_orientation(pdf_image)
+        if retried:
+            self.__emit_log_event(f'Retried orientation detection at full resolution for page {pdf_image_index}')
+        if angle is not None:
+            self.__emit_log_event(f'Detected orientation of angle {angle} for page {pdf_image_index}')
+        else:
+            angle = 0
+            self.__emit_log_event(f'Orientation detection failed for page {pdf_image_index}')
+        self.page_angles[pdf_image_index] = angle
+
+        # Rotates the image based on the detected angle.
+        self.__emit_log_event(f'Rotating page {pdf_image_index} by angle {angle}')
+        return pdf_image_index, rotate_image(pdf_image, angle), angle
+
+    def __recognize_page(self, in_file_path: Path, page: tuple[int, Image, int]) -> tuple[
+            int, int, list[OcrTextBox], DetectionProfile]:
+        (pdf_image_index, pdf_image, angle) = page
+
+        # Gets the detection profile for the size of the rotated page.
+        points_per_pixel = 72.0 / image_dpi(pdf_image)
+        detection_profile = self.detection_profiles.match(
+            pdf_image.width * points_per_pixel, pdf_image.height * points_per_pixel,
+            sheet_rotation(self.page_rotations.get(pdf_image_index, 0), angle))
+
+        # Performs OCR on either the title block or the whole page.
+        self.__emit_status_event(f'Performing OCR on page {pdf_image_index} from file {in_file_path}')
+        with self.stage_timings.measure('ocr'):
+            if self.ocr_mode in (OcrMode.TITLE_BLOCK, OcrMode.DEFERRED):
+                text_elements = self.__recognize_title_block(pdf_image, detection_profile)
+            else:
+                text_elements = self.__recognize_text_boxes(pdf_image, (0, 0, pdf_image.width, pdf_image.height))
+        self.__emit_log_event(f'Found {len(text_elements)} text elements on page {pdf_image_index}')
+
+        # The image isn't passed on, so it's released as soon as it's recognized.
+        return pdf_image_index, angle, text_elements, detection_profile
+
+    def __run_perform_ocr_on_pdf(self, in_file_path: Path, page_indices: list[int]) -> Path:
+        self.__emit_status_event(f'Obtaining images from PDF file {in_file_path}')
+
+        def iterate_rotated_pdf_images() -> Generator[Image, None, None]:
+            # Hands the oriented pages to the PDF builder as they come out of the pipeline, the next pages
+            #  are rasterized and oriented while the builder OCR's one.
+            with closing(self.__build_pipeline(in_file_path, False).run(page_indices)) as pages:
+                for pdf_image_index, pdf_image, _ in pages:
+                    # Holds off the OCR while the temp directory is too large.
+                    self.__wait_for_temp_space()
+
+                    # Adds the page to the output pdf.
+                    self.__emit_log_event(f'Adding page {pdf_image_index} to output pdf')
+                    self.__emit_status_event(f'Performing OCR on page {pdf_image_index} from file {in_file_path}')
+
+                    # The builder OCR's the page before it asks for the next one.
+                    start_time = perf_counter()
+                    yield pdf_image
+                    self.stage_timings.record('ocr', perf_counter() - start_time)
+
+                    # The routing of the OCR'ed page is cheap compared to this, so the page counts as done.
+                    self.__emit_page_event(pdf_image_index)
+
+        # Builds the PDF file, the pages are OCR'ed one after the other while building.
+        # The temp file is named after the run and the index of the file, so concurrent runs don't collide.
+        temp_file_path = self.dir_temp_path / f'{self.run_id}.{self.file_index:06d}.{in_file_path.stem}'
+        self.__wait_for_temp_space()
+        with closing(iterate_rotated_pdf_images()) as pdf_images:
+            pdf_builder = TesseractsPdfBuilder()
+            pdf_builder.set_images(pdf_images)
+            pdf_builder.set_output_file(str(temp_file_path))
+            pdf_builder.set_lang('nld')
+            pdf_builder.build()
+
+        # Finishes off and returns the path with the file ending with the PDF extension.
+        self.__emit_log_event(
+            f'Finished OCR for file with path {in_file_path}, wrote OCR\'ed file to path {temp_file_path}')
+        return temp_file_path.with_name(f'{temp_file_path.name}.pdf')
+
+    def __wait_for_temp_space(self) -> None:
+        if self.temp_max_bytes is None:
+            return
+
+        # Waits until the temp directory is small enough again. Only files which are further along in
+        #  this run are waited for, those always finish, so the workers can't end up waiting on each other.
+        wait_start_time = None
+        while True:
+            temp_size = 0
+            earlier_temp_file_exists = False
+            for temp_file_path in self.dir_temp_path.iterdir():
+                # The journal and the searchable queue are hidden, they aren't temp files.
+                if temp_file_path.name.startswith('.'):
+                    continue
+                try:
+                    temp_size += temp_file_path.stat().st_size
+                except FileNotFoundError:
+                    continue
+
+                name_parts = temp_file_path.name.split('.', 2)
+                if len(name_parts) == 3 and name_parts[0] == self.run_id and name_parts[1].isdigit() and int(
+                        name_parts[1]) < self.file_index:
+                    earlier_temp_file_exists = True
+
+            if temp_size <= self.temp_max_bytes or not earlier_temp_file_exists:
+                break
+
+            if wait_start_time is None:
+                self.__emit_log_event(f'Waiting for the temp directory to shrink, it\'s {temp_size // (1024 * 1024)}MB')
+                wait_start_time = perf_counter()
+            elif perf_counter() - wait_start_time > TEMP_SPACE_MAX_WAIT:
+                self.__emit_log_event('Temp directory didn\'t shrink in time, continuing anyway')
+                break
+            sleep(TEMP_SPACE_POLL_INTERVAL)
+
+    def __run_perform_ocr_on_original_pdf(self, in_file_path: Path, in_file_reader: PdfReader,
+                                          page_indices: list[int]) -> None:
+        self.__emit_status_event(f'Obtaining images from PDF file {in_file_path}')
+
+        # Routes the original pages instead of OCR'ed ones, in order and as soon as they're recognized. The
+        #  reader isn't thread safe, so the routing is done here instead of by a stage.
+        with closing(self.__build_pipeline(in_file_path, True).run(page_indices)) as pages:
+            for pdf_image_index, angle, text_elements, detection_profile in pages:
+                # Rotates the original page along with the image.
+                in_file_reader_page = in_file_reader.pages[pdf_image_index]
+                if angle % 360 != 0:
+                    in_file_reader_page.rotate((360 - angle) % 360)
+
+                (project_nr, drawing_nr) = self.__route_page(pdf_image_index, in_file_reader_page, text_elements,
+                                                             detection_profile)
+                self.__cache_result(pdf_image_index, project_nr, drawing_nr)
+                self.__emit_page_event(pdf_image_index)
+
+    @staticmethod
+    def __recognize_text_boxes(pdf_image: Image, crop_box: tuple[int, int, int, int]) -> list[OcrTextBox]:
+        pixels_per_point = image_dpi(pdf_image) / 72.0
+        (crop_left, crop_top, _, _) = crop_box
+
+        # Performs OCR on the (cropped) image.
+        try:
+            if crop_box != (0, 0, pdf_image.width, pdf_image.height):
+                text_lines = recognize_text_lines(pdf_image.crop(crop_box), 'nld')
+            else:
+                text_lines = recognize_text_lines(pdf_image, 'nld')
+        except pyocr.libtesseract.TesseractError:
+            return []
+
+        # Converts the line boxes to PDF coordinates of the whole page, note that PDF coordinates start at the bottom.
+        text_elements = []
+        for ((x0, y0, x1, y1), text) in text_lines:
+            text_elements.append(OcrTextBox(
+                (crop_left + x0) / pixels_per_point,
+                (pdf_image.height - (crop_top + y1)) / pixels_per_point,
+                (crop_left + x1) / pixels_per_point,
+                (pdf_image.height - (crop_top + y0)) / pixels_per_point,
+                text))
+
+        return text_elements
+
+    @staticmethod
+    def __recognize_title_block(pdf_image: Image, detection_profile: DetectionProfile) -> list[OcrTextBox]:
+        # Computes the crop box in pixels, note that PDF coordinates start at the bottom.
+        pixels_per_point = image_dpi(pdf_image) / 72.0
+        center_x, center_y = detection_profile.center_x, detection_profile.center_y
+        crop_left = int((center_x - TITLE_BLOCK_CROP_WIDTH / 2) * pixels_per_point)
+        crop_right = int((center_x + TITLE_BLOCK_CROP_WIDTH / 2) * pixels_per_point)
+        crop_top = int(pdf_image.height - (center_y + TITLE_BLOCK_CROP_HEIGHT / 2) * pixels_per_point)
+        crop_bottom = int(pdf_image.height - (center_y - TITLE_BLOCK_CROP_HEIGHT / 2) * pixels_per_point)
+        crop_left, crop_top = max(0, crop_left), max(0, crop_top)
+        crop_right, crop_bottom = min(pdf_image.width, crop_right), min(pdf_image.height, crop_bottom)
+        if crop_left >= crop_right or crop_top >= crop_bottom:
+            return []
+
+        # Performs OCR on the cropped title block.
+        return FileProcessor.__recognize_text_boxes(pdf_image, (crop_left, crop_top, crop_right, crop_bottom))
+
+    def __process_page(self, temp_file_page_index: int, temp_file_reader_page: PageObject,
+                       temp_file_page_layout: PageLayout) -> tuple[Optional[str], Optional[str]]:
+        # Gets the detection profile, the OCR'ed page is upright and has the size of the rotated image.
+        detection_profile = self.detection_profiles.match(
+            temp_file_page_layout.width, temp_file_page_layout.height,
+            sheet_rotation(self.page_rotations.get(temp_file_page_index, 0),
+                           self.page_angles.get(temp_file_page_index, 0)))
+
+        # Gets the text elements near the title, the rest of the page is only analyzed if needed.
+        self.__emit_log_event(f'Getting the text elements near the title of page {temp_file_page_index}')
+        with self.stage_timings.measure('layout'):
+            text_elements = temp_file_page_layout.text_elements_near(
+                detection_profile.center_x, detection_profile.center_y, detection_profile.tolerance)
+        self.__emit_log_event(f'Found {len(text_elements)} text elements on page {temp_file_page_index} of pdf file')
+
+        return self.__route_page(temp_file_page_index, temp_file_reader_page, text_elements, detection_profile)
+
+    def __find_title(self, temp_file_page_index: int, text_elements: Iterable[LTTextContainer | OcrTextBox],
+                     detection_profile: DetectionProfile) -> tuple[Optional[str], Optional[str]]:
+        project_nr = None
+        drawing_nr = None
+        start_time = perf_counter()
+
+        # Builds the spatial index over the centers of the text elements.
+        text_element_index = TextElementIndex(list(text_elements))
+
+        # Loops over the text elements of which the center is near the title detection center of the profile.
+        self.__emit_log_event(f'Attempting to find title of document using profile {detection_profile.name}')
+        for text_element in text_element_index.query_radius(detection_profile.center_x, detection_profile.center_y,
+                                                            detection_profile.tolerance):
+            # Gets the text from the element.
+            title = text_element.get_text()
+
+            # Attempts to get the project number and the drawing number from the title.
+            match = detection_profile.pattern.search(title)
+            if match is not None:
+                # Gets the project number and the drawing number.
+                project_nr = match.group(1)
+                drawing_nr = match.group(2)
+
+                # Prints that we detected the project and drawing number.
+                self.__emit_log_event(
+                    f'Detected project number {project_nr} and drawing number {drawing_nr} for '
+                    f'page {temp_file_page_index}')
+            else:
+                self.__emit_log_event(f'Failed to detect title for page {temp_file_page_index}')
+
+            # We found the element, so just exit.
+            break
+
+        # Records how well the profile performs.
+        self.profile_statistics.record(detection_profile, project_nr is not None, perf_counter() - start_time)
+        self.stage_timings.record('title', perf_counter() - start_time)
+
+        return project_nr, drawing_nr
+
+    def __route_page(self, temp_file_page_index: int, temp_file_reader_page: PageObject,
+                     text_elements: Iterable[LTTextContainer | OcrTextBox],
+                     detection_profile: DetectionProfile) -> tuple[Optional[str], Optional[str]]:
+        (project_nr, drawing_nr) = self.__find_title(temp_file_page_index, text_elements, detection_profile)
+
+        # Checks to which path the output page should be written.
+        if project_nr is not None and drawing_nr is not None:
+            self.__write_succeeded_page(project_nr, drawing_nr, temp_file_reader_page, temp_file_page_index)
+        else:
+            self.__write_failed_page(temp_file_reader_page, temp_file_page_index)
+
+        return project_nr, drawing_nr
+
+    def __record_written_file(self, file_path: Path, page_indices: list[int]) -> None:
+        # Adds the archived drawing to the index as soon as its file is written, before the journal skips its page.
+        drawing = self.pending_drawings.pop(file_path, None)
+        if drawing is not None and self.archive_index is not None:
+            self.archive_index.mark_written(drawing)
+
+        # Marks the pages as done as soon as their file is written, a restart skips them.
+        if self.journal is not None and self.file_key is not None and len(page_indices) != 0:
+            self.journal.put_written_pages(self.file_key, page_indices, file_path)
+
+        # Queues the archived original pages to be made searchable, unless they have text already.
+        if self.ocr_mode == OcrMode.DEFERRED and self.searchable_queue is not None and file_path.is_relative_to(
+                self.dir_out_path) and not set(page_indices) <= self.text_layer_page_indices:
+            self.searchable_queue.put(file_path)
+
+    def __get_or_build_intermediate(self, in_file_path: Path, page_indices: list[int]) -> Intermediate:
+        # Reuses the temp file of an earlier run if it's still there and has all the pages needed.
+        if self.journal is not None and self.file_key is not None:
+            intermediate = self.journal.get_intermediate(self.file_key)
+            if intermediate is not None and intermediate.temp_file_path.exists() and set(page_indices) <= set(
+                    intermediate.page_indices):
+                self.__emit_log_event(f'Reusing the OCR\'ed temp file {intermediate.temp_file_path} of an earlier run')
+                self.page_angles.update(intermediate.page_angles)
+                return intermediate
+
+        temp_file_path = self.__run_perform_ocr_on_pdf(in_file_path, page_indices)
+        intermediate = Intermediate(temp_file_path, page_indices, dict(self.page_angles))
+        if self.journal is not None and self.file_key is not None:
+            self.journal.put_intermediate(self.file_key, intermediate)
+
+        return intermediate
+
+    def __process_temp_file(self, temp_file_path: Path, temp_file_page_indices: list[int],
+                            page_indices: list[int]) -> None:
+        # Opens the temp file.
+        self.__emit_log_event(f'Opening temp file {temp_file_path}')
+        with temp_file_path.open('rb') as temp_file:
+            # Reads the temp file.
+            self.__emit_log_event(f'Reading temp file {temp_file_path}')
+            temp_file_reader = PdfReader(temp_file)
+            temp_file_page_layouts = iterate_page_layouts(temp_file_path)
+
+            # Processes the pages that still have to be routed, the pages of the temp file are the
+            #  OCR'ed pages with the given indices in the input file. The layout of the other pages isn't analyzed.
+            remaining_page_indices = set(page_indices)
+            for temp_file_page_index, temp_file_reader_page, temp_file_page_layout in zip(
+                    temp_file_page_indices, temp_file_reader.pages, temp_file_page_layouts):
+                if temp_file_page_index not in remaining_page_indices:
+                    continue
+                (project_nr, drawing_nr) = self.__process_page(temp_file_page_index, temp_file_reader_page,
+                                                               temp_file_page_layout)
+                self.__cache_result(temp_file_page_index, project_nr, drawing_nr)
+
+            # Writes the routed pages while the temp file is still open.
+            self.__flush_output()
+
+    def __flush_output(self) -> None:
+        if len(self.output_writer) == 0:
+            return
+
+        self.__emit_log_event(f'Writing {len(self.output_writer)} output files')
+        with self.stage_timings.measure('write'):
+            written_file_paths = self.output_writer.flush(self.__record_written_file)
+        for file_path in written_file_paths:
+            self.__emit_log_event(f'Wrote output file {file_path}')
+
+    def __move_finished_file(self, in_file_path: Path):
+        new_in_file_path = self.dir_finished_path / in_file_path.name
+        self.__emit_log_event(f'Moving in file {in_file_path} to {new_in_file_path}')
+        in_file_path.rename(new_in_file_path)
+
+    def __write_failed_page(self, page: PageObject, page_index: int) -> None:
+        # Creates the file path, unique even for pages routed within the same clock tick.
+        file_path = self.dir_manual_path / f'{int(time())}.{uuid.uuid4().hex}.pdf'
+
+        # Adds the page to the output, it's written once the whole file is routed.
+        self.output_writer.add_page(file_path, page, page_index)
+
+    def __write_succeeded_page(self, project_no: str, drawing_no: str, page: PageObject, page_index: int) -> None:
+        # Creates the directory path and the file path.
+        secondary_dir_path = (self.dir_out_path / f'{project_no[0:2]}{"".join("X" for _ in range(len(project_no) - 2))}'
+                              / project_no)
+        tertiary_file_path = secondary_dir_path / drawing_file_name(project_no, drawing_no, 1)
+
+        # Looks up which revision the page becomes, if it isn't archived already.
+        if self.archive_index is not None:
+            revision_file_path = self.__get_revision_file_path(self.archive_index, project_no, drawing_no,
+                                                               secondary_dir_path, page_index)
+            if revision_file_path is None:
+                return
+            tertiary_file_path = revision_file_path
+
+        # Makes the directory and it's parents for the output file.
+        secondary_dir_path.mkdir(parents=True, exist_ok=True)
+
+        # Adds the page to the output, it's written once the whole file is routed.
+        self.output_writer.add_page(tertiary_file_path, page, page_index)
+
+    def __get_revision_file_path(self, archive_index: ArchiveIndex, project_no: str, drawing_no: str,
+                                 dir_path: Path, page_index: int) -> Optional[Path]:
+        # Reserves the revision the page becomes, unless the same page is archived as the drawing already.
+        drawing = archive_index.reserve(project_no, drawing_no, dir_path, self.page_hashes[page_index],
+                                        str(self.in_file_path), page_index, self.run_id)
+        if drawing is None:
+            self.__emit_log_event(f'Page {page_index} is archived already as drawing {project_no}.{drawing_no}, '
+                                  f'skipping it')
+            return None
+
+        if drawing.revision > 1:
+            self.__emit_log_event(f'Page {page_index} is revision {drawing.revision} of drawing {drawing.title()}')
+        self.pending_drawings[drawing.output_path] = drawing
+        return drawing.output_path
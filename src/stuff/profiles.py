@@ -0,0 +1,159 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+from PyPDF2 import PageObject
+from PyPDF2.generic import IndirectObject
+import json
+import re
+
+TITLE_DETECT_CENTER_X = 730.98
+TITLE_DETECT_CENTER_Y = 64.752
+TITLE_DETECT_TOLERNACE = 15
+TITLE_DETECT_PATTERN = r'([0-9]+)\.([0-9.]+)'
+
+# The page sizes are looked up in buckets of this many points.
+PAGE_SIZE_BUCKET = 10.0
+
+# The difference in points between the size of a page and the size of a profile for it to still match.
+PAGE_SIZE_TOLERANCE = 10.0
+
+
+class DetectionProfile(object):
+    '''
+    Where the title is on a certain kind of sheet, and what it looks like. The
+    first group of the pattern is the project number, the second one the
+    drawing number. Without a page size or rotation the profile matches any.
+
+    The page size is the size of the upright sheet. The rotation is the
+    angle by which the page as drawn in the PDF is turned clockwise to make
+    it upright: the rotation of the page itself, less the angle orientation
+    detection turned it counter-clockwise by after that.
+    '''
+
+    def __init__(self, name: str, center_x: float, center_y: float, tolerance: float = TITLE_DETECT_TOLERNACE,
+                 pattern: str = TITLE_DETECT_PATTERN, page_width: Optional[float] = None,
+                 page_height: Optional[float] = None, rotation: Optional[int] = None) -> None:
+        self.name = name
+        self.center_x = center_x
+        self.center_y = center_y
+        self.tolerance = tolerance
+        self.pattern = re.compile(pattern)
+        self.page_width = page_width
+        self.page_height = page_height
+        self.rotation = rotation
+
+    @staticmethod
+    def from_dict(data: dict) -> DetectionProfile:
+        return DetectionProfile(data['name'], float(data['center_x']), float(data['center_y']),
+                                float(data.get('tolerance', TITLE_DETECT_TOLERNACE)),
+                                data.get('pattern', TITLE_DETECT_PATTERN),
+                                float(data['page_width']) if data.get('page_width') is not None else None,
+                                float(data['page_height']) if data.get('page_height') is not None else None,
+                                int(data['rotation']) if data.get('rotation') is not None else None)
+
+
+def page_rotation(page: PageObject) -> int:
+    # The reader copies a rotation inherited from the page tree onto the page, but it might be an indirect object.
+    rotation = page.get('/Rotate', 0)
+    if isinstance(rotation, IndirectObject):
+        rotation = rotation.get_object()
+    return int(rotation) % 360
+
+
+def sheet_rotation(page_rotation: int, angle: int) -> int:
+    '''
+    Get the rotation a profile is matched on of a page with the given
+    rotation, of which orientation detection found the given angle.
+    '''
+    return (page_rotation - angle) % 360
+
+
+# The profile of the sheets the detection was originally made for, used when no other profile matches.
+DEFAULT_DETECTION_PROFILE = DetectionProfile('Standaard', TITLE_DETECT_CENTER_X, TITLE_DETECT_CENTER_Y)
+
+
+class ProfileStatistics(object):
+    '''
+    The number of pages each profile was tried on, the number of pages it
+    found the title on and the time it took.
+    '''
+
+    def __init__(self) -> None:
+        self.attempts: dict[str, int] = {}
+        self.hits: dict[str, int] = {}
+        self.seconds: dict[str, float] = {}
+
+    def record(self, profile: DetectionProfile, hit: bool, seconds: float) -> None:
+        self.attempts[profile.name] = self.attempts.get(profile.name, 0) + 1
+        self.hits[profile.name] = self.hits.get(profile.name, 0) + (1 if hit else 0)
+        self.seconds[profile.name] = self.seconds.get(profile.name, 0.0) + seconds
+
+    def merge(self, other: ProfileStatistics) -> None:
+        for name, attempts in other.attempts.items():
+            self.attempts[name] = self.attempts.get(name, 0) + attempts
+            self.hits[name] = self.hits.get(name, 0) + other.hits.get(name, 0)
+            self.seconds[name] = self.seconds.get(name, 0.0) + other.seconds.get(name, 0.0)
+
+    def summary(self) -> list[str]:
+        return [
+            f'Profile {name}: title found on {self.hits[name]} of {attempts} pages '
+            f'({self.hits[name] / attempts * 100.0:.1f}%), {self.seconds[name] / attempts * 1000.0:.2f}ms per page'
+            for name, attempts in sorted(self.attempts.items())
+        ]
+
+
+class DetectionProfiles(object):
+    '''
+    Table of detection profiles, precomputed so the profile of a page is
+    found with a single lookup of its (bucketed) size and rotation.
+    '''
+
+    def __init__(self, profiles: list[DetectionProfile],
+                 default_profile: DetectionProfile = DEFAULT_DETECTION_PROFILE) -> None:
+        self.profiles = profiles
+        self.default_profile = default_profile
+
+        # Profiles for any page size, by rotation.
+        self.rotation_table: dict[int, DetectionProfile] = {}
+        # Profiles for a certain page size, by bucketed width, height and rotation.
+        self.size_table: dict[tuple[int, int, int], DetectionProfile] = {}
+
+        # Fills the tables, the profiles listed first take precedence.
+        for profile in reversed(profiles):
+            rotations = [profile.rotation % 360] if profile.rotation is not None else [0, 90, 180, 270]
+            if profile.page_width is None or profile.page_height is None:
+                for rotation in rotations:
+                    self.rotation_table[rotation] = profile
+                continue
+
+            # Registers the profile in all the buckets within the tolerance, so a lookup is a single get.
+            for width_bucket in self.__buckets(profile.page_width):
+                for height_bucket in self.__buckets(profile.page_height):
+                    for rotation in rotations:
+                        self.size_table[(width_bucket, height_bucket, rotation)] = profile
+
+    @staticmethod
+    def __buckets(size: float) -> range:
+        return range(int((size - PAGE_SIZE_TOLERANCE) // PAGE_SIZE_BUCKET),
+                     int((size + PAGE_SIZE_TOLERANCE) // PAGE_SIZE_BUCKET) + 1)
+
+    @staticmethod
+    def load(path: Optional[Path]) -> DetectionProfiles:
+        # Without a profiles file only the default profile is used.
+        if path is None or not path.exists():
+            return DetectionProfiles([])
+
+        with path.open('r', encoding='utf-8') as profiles_file:
+            data = json.load(profiles_file)
+
+        return DetectionProfiles([DetectionProfile.from_dict(profile_data) for profile_data in data])
+
+    def match(self, page_width: float, page_height: float, rotation: int = 0) -> DetectionProfile:
+        rotation = rotation % 360
+
+        profile = self.size_table.get(
+            (int(page_width // PAGE_SIZE_BUCKET), int(page_height // PAGE_SIZE_BUCKET), rotation))
+        if profile is not None:
+            return profile
+
+        return self.rotation_table.get(rotation, self.default_profile)
@@ -0,0 +1,40 @@
+from __future__ import annotations
+from PIL.Image import Image, Transpose
+import math
+
+# The pages are rasterized so that text of this height in points is about this many pixels high, which
+#  Tesseract reads well. That's 200 dpi, unless the page is so large it'd exceed the maximum pixel count.
+RASTERIZE_TEXT_HEIGHT_POINTS = 9.0
+RASTERIZE_TEXT_HEIGHT_PIXELS = 25.0
+RASTERIZE_MIN_DPI = 100
+RASTERIZE_MAX_PIXELS = 40_000_000
+
+
+def rasterize_dpi(page_width: float, page_height: float) -> int:
+    '''
+    Get the resolution to rasterize a page of the given size (in points) at,
+    based on the height of the text on it and the size of the page.
+    '''
+    text_dpi = RASTERIZE_TEXT_HEIGHT_PIXELS / RASTERIZE_TEXT_HEIGHT_POINTS * 72.0
+    max_dpi = math.sqrt(RASTERIZE_MAX_PIXELS / max(1.0, page_width * page_height)) * 72.0
+    return int(max(RASTERIZE_MIN_DPI, min(text_dpi, max_dpi)))
+
+
+def image_dpi(image: Image) -> float:
+    # The resolution is stored with the image when it's rasterized, cropping and rotating keeps it.
+    return float(image.info['dpi'][0])
+
+
+def rotate_image(image: Image, angle: int) -> Image:
+    '''
+    Rotate an image counter-clockwise, multiples of 90 degrees are transposed
+    which is lossless and doesn't resample.
+    '''
+    transpose_method = {90: Transpose.ROTATE_90, 180: Transpose.ROTATE_180, 270: Transpose.ROTATE_270}
+    angle = angle % 360
+    if angle == 0:
+        return image
+    if angle in transpose_method:
+        return image.transpose(transpose_method[angle])
+
+    return image.rotate(angle, expand=True)
@@ -0,0 +1,212 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+from PIL.Image import Image
+from PyPDF2 import PageObject, PdfReader, PdfWriter
+from pdf2image import pdf2image
+from time import time
+import os
+import sqlite3
+import uuid
+from .events import ConverterUpdateEvent, ConverterLogEvent
+from .tesseract import TesseractsPdfBuilder
+from .raster import rasterize_dpi
+from .profiles import page_rotation
+from .store import SqliteStore
+
+# The name of the queue in the temp directory.
+SEARCHABLE_QUEUE_FILE_NAME = '.searchable.sqlite3'
+
+# The number of times making a file searchable is attempted before it's given up on.
+SEARCHABLE_MAX_ATTEMPTS = 3
+
+
+def text_layer_transformation(page: PageObject, text_page_width: float,
+                              text_page_height: float) -> tuple[float, float, float, float, float, float]:
+    '''
+    Get the transformation that puts the text layer OCR'ed from the upright
+    rendering of a page onto the page itself: scaled to the crop box that
+    was rendered, and turned back by the rotation of the page.
+    '''
+    (x0, y0, x1, y1) = [float(v) for v in page.cropbox]
+    (width, height) = (x1 - x0, y1 - y0)
+
+    # The rendering has the width and height swapped if the page is turned a quarter.
+    rotation = page_rotation(page)
+    (rendered_width, rendered_height) = (height, width) if rotation % 180 == 90 else (width, height)
+    scale_x = rendered_width / text_page_width
+    scale_y = rendered_height / text_page_height
+
+    return {
+        0: (scale_x, 0.0, 0.0, scale_y, x0, y0),
+        90: (0.0, scale_x, -scale_y, 0.0, x0 + width, y0),
+        180: (-scale_x, 0.0, 0.0, -scale_y, x0 + width, y0 + height),
+        270: (0.0, -scale_x, scale_y, 0.0, x0, y0 + height),
+    }[rotation]
+
+
+class SearchableJob(object):
+    '''
+    An archived file that has to be replaced by a searchable version, with the
+    size and modification time it had when it was archived. If it changed
+    since, it was archived again and the job is outdated.
+    '''
+
+    def __init__(self, output_path: Path, signature: tuple[int, int], attempts: int = 0) -> None:
+        self.output_path = output_path
+        self.signature = signature
+        self.attempts = attempts
+
+
+class SearchableQueue(SqliteStore):
+    '''
+    On-disk queue of archived files that still have to be made searchable.
+    '''
+
+    @staticmethod
+    def signature(file_path: Path) -> Optional[tuple[int, int]]:
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            return None
+
+        return stat.st_size, stat.st_mtime_ns
+
+    def create_schema(self, connection: sqlite3.Connection) -> None:
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS jobs (output_path TEXT PRIMARY KEY, size INTEGER NOT NULL, '
+            'mtime_ns INTEGER NOT NULL, attempts INTEGER NOT NULL, enqueued REAL NOT NULL)')
+
+    def __len__(self) -> int:
+        (count,) = self.connect().execute('SELECT COUNT(*) FROM jobs').fetchone()
+        return count
+
+    def put(self, output_path: Path) -> None:
+        signature = self.signature(output_path)
+        if signature is None:
+            return
+
+        # A file that's archived again replaces its earlier job.
+        connection = self.connect()
+        connection.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, 0, ?)',
+                           (str(output_path), signature[0], signature[1], time()))
+        connection.commit()
+
+    def next(self) -> Optional[SearchableJob]:
+        # The oldest job goes first.
+        row = self.connect().execute(
+            'SELECT output_path, size, mtime_ns, attempts FROM jobs ORDER BY enqueued LIMIT 1').fetchone()
+        if row is None:
+            return None
+
+        return SearchableJob(Path(row[0]), (row[1], row[2]), row[3])
+
+    def complete(self, job: SearchableJob) -> None:
+        # Only removes the job if it wasn't replaced by a newer one in the meantime.
+        connection = self.connect()
+        connection.execute('DELETE FROM jobs WHERE output_path = ? AND size = ? AND mtime_ns = ?',
+                           (str(job.output_path), job.signature[0], job.signature[1]))
+        connection.commit()
+
+    def fail(self, job: SearchableJob) -> None:
+        # Moves the job to the back of the queue, or gives up on it after too many attempts.
+        if job.attempts + 1 >= SEARCHABLE_MAX_ATTEMPTS:
+            self.complete(job)
+            return
+
+        connection = self.connect()
+        connection.execute(
+            'UPDATE jobs SET attempts = ?, enqueued = ? WHERE output_path = ? AND size = ? AND mtime_ns = ?',
+            (job.attempts + 1, time(), str(job.output_path), job.signature[0], job.signature[1]))
+        connection.commit()
+
+
+class SearchableWorker(object):
+    '''
+    Replaces archived files by OCR'ed, searchable versions, one file at a
+    time, so it can be done in between the actual work.
+    '''
+
+    def __init__(self, queue: SearchableQueue):
+        self.queue = queue
+        self.event_callback: Optional[Callable[[ConverterUpdateEvent | ConverterLogEvent], None]] = None
+
+    def __emit_log_event(self, message: str) -> None:
+        if self.event_callback is not None:
+            self.event_callback(ConverterLogEvent(time(), message))
+
+    def run_one(self) -> bool:
+        '''
+        Make the next file in the queue searchable, returns False if the queue
+        was empty.
+        '''
+        job = self.queue.next()
+        if job is None:
+            return False
+
+        try:
+            self.__make_searchable(job)
+        except Exception as e:
+            self.__emit_log_event(f'Failed to make {job.output_path} searchable: {e}')
+            self.queue.fail(job)
+            return True
+
+        self.queue.complete(job)
+        return True
+
+    @staticmethod
+    def __iterate_page_images(file_path: Path, page_sizes: list[tuple[float, float]]) -> Iterator[Image]:
+        # Rasterizes the pages one at a time, upright since the rotation of the archived page is applied.
+        for page_index, (page_width, page_height) in enumerate(page_sizes):
+            dpi = rasterize_dpi(page_width, page_height)
+            (page_image,) = pdf2image.convert_from_path(file_path, dpi=dpi, fmt='ppm', grayscale=True,
+                                                        first_page=page_index + 1, last_page=page_index + 1)
+            page_image.info['dpi'] = (dpi, dpi)
+            yield page_image
+
+    def __make_searchable(self, job: SearchableJob) -> None:
+        # Skips the file if it's gone or archived again since, there's a newer job for it in that case.
+        if self.queue.signature(job.output_path) != job.signature:
+            self.__emit_log_event(f'Skipping {job.output_path}, it changed since it was archived')
+            return
+
+        self.__emit_log_event(f'Making {job.output_path} searchable')
+        with job.output_path.open('rb') as output_file:
+            page_sizes = [(float(page.mediabox.width), float(page.mediabox.height))
+                          for page in PdfReader(output_file).pages]
+
+        # Builds the text layer and the searchable version next to the file, so it can be moved in place.
+        temp_file_path = job.output_path.with_name(f'.{job.output_path.name}.{uuid.uuid4().hex}')
+        text_layer_file_path = temp_file_path.with_name(f'{temp_file_path.name}.pdf')
+        searchable_file_path = temp_file_path.with_name(f'{temp_file_path.name}.searchable.pdf')
+        try:
+            # Only the text is rendered, the pages themselves stay as they were archived, in color and vector.
+            pdf_builder = TesseractsPdfBuilder()
+            pdf_builder.set_images(self.__iterate_page_images(job.output_path, page_sizes))
+            pdf_builder.set_output_file(str(temp_file_path))
+            pdf_builder.set_lang('nld')
+            pdf_builder.set_text_only(True)
+            pdf_builder.build()
+
+            # Puts the invisible text of each page on top of the archived page.
+            with job.output_path.open('rb') as output_file, text_layer_file_path.open('rb') as text_layer_file:
+                pdf_writer = PdfWriter()
+                for page, text_page in zip(PdfReader(output_file).pages, PdfReader(text_layer_file).pages):
+                    text_page.add_transformation(text_layer_transformation(
+                        page, float(text_page.mediabox.width), float(text_page.mediabox.height)))
+                    page.merge_page(text_page)
+                    pdf_writer.add_page(page)
+                with searchable_file_path.open('wb') as searchable_file:
+                    pdf_writer.write(searchable_file)
+
+            # Checks once more that the file wasn't archived again while OCR'ing.
+            if self.queue.signature(job.output_path) != job.signature:
+                self.__emit_log_event(f'Skipping {job.output_path}, it changed while it was made searchable')
+                return
+
+            os.replace(searchable_file_path, job.output_path)
+        finally:
+            text_layer_file_path.unlink(missing_ok=True)
+            searchable_file_path.unlink(missing_ok=True)
+
+        self.__emit_log_event(f'Replaced {job.output_path} by its searchable version')
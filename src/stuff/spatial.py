@@ -0,0 +1,74 @@
+from __future__ import annotations
+from typing import Generic, Protocol, Sequence, TypeVar
+import math
+import numpy as np
+
+# The size (in points) of the cells of the grid.
+GRID_CELL_SIZE = 50.0
+
+
+class Box(Protocol):
+    # The bounding box attributes of pdfminer's layout objects, which the OCR'ed text boxes have as well.
+    @property
+    def x0(self) -> float: ...
+
+    @property
+    def y0(self) -> float: ...
+
+    @property
+    def x1(self) -> float: ...
+
+    @property
+    def y1(self) -> float: ...
+
+
+T = TypeVar('T', bound=Box)
+
+
+class TextElementIndex(Generic[T]):
+    '''
+    Grid over the centers of the text elements of a page, built once per page
+    so any number of points can be looked up without scanning all elements.
+    The elements need the bounding box attributes of pdfminer's layout
+    objects.
+    '''
+
+    def __init__(self, elements: Sequence[T], cell_size: float = GRID_CELL_SIZE):
+        self.elements = list(elements)
+        self.cell_size = cell_size
+
+        # Computes the centers of all the elements at once.
+        boxes = np.array([(e.x0, e.y0, e.x1, e.y1) for e in self.elements], dtype=np.float64).reshape(-1, 4)
+        self.centers = (boxes[:, 0:2] + boxes[:, 2:4]) / 2.0
+
+        # Groups the element indices by the cell their center is in, the indices stay in document order.
+        cells = np.floor(self.centers / cell_size).astype(np.int64)
+        self.cells: dict[tuple[int, int], np.ndarray] = {}
+        if len(self.elements) != 0:
+            order = np.lexsort((np.arange(len(cells)), cells[:, 1], cells[:, 0]))
+            unique_cells, starts = np.unique(cells[order], axis=0, return_index=True)
+            for cell, indices in zip(unique_cells, np.split(order, starts[1:])):
+                self.cells[(int(cell[0]), int(cell[1]))] = indices
+
+    def __len__(self) -> int:
+        return len(self.elements)
+
+    def query_radius(self, x: float, y: float, r: float) -> list[T]:
+        '''
+        Get the elements of which the center is within distance r of (x, y),
+        in document order.
+        '''
+        # Collects the candidates from all the cells overlapping the bounding box of the circle.
+        candidates = [
+            self.cells[(cell_x, cell_y)]
+            for cell_x in range(math.floor((x - r) / self.cell_size), math.floor((x + r) / self.cell_size) + 1)
+            for cell_y in range(math.floor((y - r) / self.cell_size), math.floor((y + r) / self.cell_size) + 1)
+            if (cell_x, cell_y) in self.cells
+        ]
+        if len(candidates) == 0:
+            return []
+
+        # Keeps the candidates that are actually within the circle.
+        indices = np.concatenate(candidates)
+        distances = np.hypot(self.centers[indices, 0] - x, self.centers[indices, 1] - y)
+        return [self.elements[i] for i in np.sort(indices[distances <= r])]
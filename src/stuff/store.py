@@ -0,0 +1,39 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+import sqlite3
+
+
+class SqliteStore(object):
+    '''
+    An SQLite database on disk, opened lazily so the store can be sent along
+    to worker processes. Subclasses create their tables in create_schema,
+    which is called each time the database is opened.
+    '''
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.connection: Optional[sqlite3.Connection] = None
+
+    def __getstate__(self) -> dict:
+        # Connections can't be shared between processes, each one opens its own.
+        state = self.__dict__.copy()
+        state['connection'] = None
+        return state
+
+    def create_schema(self, connection: sqlite3.Connection) -> None:
+        raise NotImplementedError()
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30.0)
+            self.create_schema(self.connection)
+            self.connection.commit()
+
+        return self.connection
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
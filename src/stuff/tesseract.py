@@ -0,0 +1,236 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Iterator
+from pyocr import pyocr
+from time import time
+import ctypes
+import threading
+
+# The number of seconds after which an unused Tesseract handle is cleaned up.
+HANDLE_IDLE_TIMEOUT = 60.0
+
+
+class TesseractHandlePool(object):
+    '''
+    Keeps initialized Tesseract handles around so the traineddata of a
+    language is loaded only once per process, instead of once per page.
+    '''
+
+    def __init__(self, idle_timeout: float = HANDLE_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.idle_handles: dict[str, list[tuple[object, float]]] = {}
+
+    @contextmanager
+    def acquire(self, lang: str) -> Iterator[object]:
+        # Takes an idle handle for the language, or initializes a new one if there's none.
+        with self.lock:
+            idle_handles = self.idle_handles.get(lang, [])
+            handle = idle_handles.pop()[0] if len(idle_handles) != 0 else None
+        if handle is None:
+            handle = pyocr.libtesseract.tesseract_raw.init(lang=lang)
+
+        try:
+            yield handle
+        except BaseException:
+            # The state of the handle is unknown after a failure, so it's not reused.
+            pyocr.libtesseract.tesseract_raw.cleanup(handle)
+            raise
+
+        # Gives the handle back to the pool.
+        with self.lock:
+            self.idle_handles.setdefault(lang, []).append((handle, time()))
+
+        self.cleanup_idle()
+
+    def cleanup_idle(self) -> None:
+        # Removes the handles which haven't been used for a while from the pool.
+        with self.lock:
+            now = time()
+            expired_handles: list[object] = []
+            for lang, idle_handles in self.idle_handles.items():
+                expired_handles.extend(handle for handle, t in idle_handles if now - t > self.idle_timeout)
+                idle_handles[:] = [(handle, t) for handle, t in idle_handles if now - t <= self.idle_timeout]
+
+        for handle in expired_handles:
+            pyocr.libtesseract.tesseract_raw.cleanup(handle)
+
+    def close(self) -> None:
+        # Cleans up all the idle handles.
+        with self.lock:
+            handles = [handle for idle_handles in self.idle_handles.values() for handle, _ in idle_handles]
+            self.idle_handles.clear()
+
+        for handle in handles:
+            pyocr.libtesseract.tesseract_raw.cleanup(handle)
+
+
+# The handle pool of this process, shared by all pages and files.
+handle_pool = TesseractHandlePool()
+
+
+def set_image(handle, image) -> None:
+    '''
+    Hand an image to Tesseract. Unlike the pyocr version, grayscale images
+    are passed as they are instead of being converted to RGB first.
+    '''
+    if image.mode != 'L':
+        image = image.convert('L' if image.mode == '1' else 'RGB')
+    bytes_per_pixel = 1 if image.mode == 'L' else 3
+
+    pyocr.libtesseract.tesseract_raw.g_libtesseract.TessBaseAPISetImage(
+        ctypes.c_void_p(handle),
+        image.tobytes('raw', image.mode),
+        ctypes.c_int(image.width),
+        ctypes.c_int(image.height),
+        ctypes.c_int(bytes_per_pixel),
+        ctypes.c_int(image.width * bytes_per_pixel)
+    )
+
+    dpi = image.info.get('dpi', [pyocr.libtesseract.tesseract_raw.DPI_DEFAULT])[0]
+    pyocr.libtesseract.tesseract_raw.g_libtesseract.TessBaseAPISetSourceResolution(
+        ctypes.c_void_p(handle), int(round(dpi))
+    )
+
+
+def detect_orientation(image) -> int:
+    '''
+    Detect the orientation of an image, returns the angle by which it has to
+    be rotated counter-clockwise to be upright.
+    '''
+    # C-API with Tesseract 4 segfaults if running OSD_ONLY psm mode with other
+    #  than osd language, so it gets a handle of its own.
+    with handle_pool.acquire('osd') as handle:
+        pyocr.libtesseract.tesseract_raw.set_page_seg_mode(
+            handle, pyocr.libtesseract.tesseract_raw.PageSegMode.OSD_ONLY
+        )
+        set_image(handle, image)
+        os = pyocr.libtesseract.tesseract_raw.detect_os(handle)
+
+    if os['confidence'] <= 0:
+        raise pyocr.libtesseract.TesseractError(
+            "no script", "no script detected"
+        )
+
+    return {
+        pyocr.libtesseract.tesseract_raw.Orientation.PAGE_UP: 0,
+        pyocr.libtesseract.tesseract_raw.Orientation.PAGE_RIGHT: 90,
+        pyocr.libtesseract.tesseract_raw.Orientation.PAGE_DOWN: 180,
+        pyocr.libtesseract.tesseract_raw.Orientation.PAGE_LEFT: 270,
+    }[os['orientation']]
+
+
+class TesseractsPdfBuilder(object):
+    def __init__(self):
+        self.images = []
+        self.output_file = None
+        self.lang = None
+        self.text_only = False
+
+    def set_lang(self, lang):
+        self.lang = lang
+        return self
+
+    def set_output_file(self, output_file):
+        self.output_file = output_file
+        return self
+
+    def set_text_only(self, text_only):
+        self.text_only = text_only
+        return self
+
+    def add_image(self, img):
+        self.images.append(img)  # or something else
+        return self
+
+    def set_images(self, images):
+        # The images may be a generator, they're only consumed while building.
+        self.images = images
+        return self
+
+    def __validate(self):
+        if isinstance(self.images, list) and len(self.images) < 1:
+            raise ValueError(
+                "At least one image is required to build the pdf!"
+            )
+
+        if self.output_file is None:
+            raise ValueError("An output-file is required to build the pdf!")
+
+    def build(self):
+        '''
+        Create and write PDF file.
+        '''
+        self.__validate()
+
+        with handle_pool.acquire(self.lang) as handle:
+            renderer = None
+            try:
+                pyocr.libtesseract.tesseract_raw.set_page_seg_mode(
+                    handle, pyocr.libtesseract.tesseract_raw.PageSegMode.SPARSE_TEXT
+                )
+
+                renderer = pyocr.libtesseract.tesseract_raw.init_pdf_renderer(
+                    handle, self.output_file, self.text_only
+                )
+                assert renderer
+
+                pyocr.libtesseract.tesseract_raw.begin_document(renderer, "")
+
+                image_count = 0
+                for image in self.images:
+                    set_image(handle, image)
+
+                    # tesseract_raw.set_input_name(handle, input_file)
+                    pyocr.libtesseract.tesseract_raw.recognize(handle)
+
+                    pyocr.libtesseract.tesseract_raw.add_renderer_image(handle, renderer)
+                    image_count += 1
+                pyocr.libtesseract.tesseract_raw.end_document(renderer)
+
+                if image_count < 1:
+                    raise ValueError(
+                        "At least one image is required to build the pdf!"
+                    )
+            finally:
+                # The handle goes back to the pool, only the renderer is cleaned up.
+                if renderer:
+                    pyocr.libtesseract.tesseract_raw.cleanup(renderer)
+
+
+def recognize_text_lines(image, lang) -> list[tuple[tuple[int, int, int, int], str]]:
+    '''
+    Recognize the text lines in an image, returns their bounding boxes
+    (left, top, right, bottom) in pixels together with their text.
+    '''
+    with handle_pool.acquire(lang) as handle:
+        pyocr.libtesseract.tesseract_raw.set_page_seg_mode(
+            handle, pyocr.libtesseract.tesseract_raw.PageSegMode.SPARSE_TEXT
+        )
+
+        set_image(handle, image)
+        pyocr.libtesseract.tesseract_raw.recognize(handle)
+
+        # Without any recognized text there's no iterator.
+        res_iterator = pyocr.libtesseract.tesseract_raw.get_iterator(handle)
+        if res_iterator is None:
+            return []
+        page_iterator = pyocr.libtesseract.tesseract_raw.result_iterator_get_page_iterator(res_iterator)
+
+        lvl_line = pyocr.libtesseract.tesseract_raw.PageIteratorLevel.TEXTLINE
+
+        lines = []
+        try:
+            while True:
+                text = pyocr.libtesseract.tesseract_raw.result_iterator_get_utf8_text(res_iterator, lvl_line)
+                (r, box) = pyocr.libtesseract.tesseract_raw.page_iterator_bounding_box(page_iterator, lvl_line)
+                if r and text is not None and text.strip() != '':
+                    lines.append((tuple(box), text))
+
+                if not pyocr.libtesseract.tesseract_raw.page_iterator_next(page_iterator, lvl_line):
+                    break
+        finally:
+            # The handle outlives the iterator, so it has to be freed explicitly.
+            pyocr.libtesseract.tesseract_raw.page_iterator_delete(page_iterator)
+
+        return lines
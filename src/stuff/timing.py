@@ -0,0 +1,168 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+from time import perf_counter, time
+import json
+import math
+import sys
+
+if sys.platform == 'win32':
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        # PROCESS_MEMORY_COUNTERS, from <psapi.h>.
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+    kernel32 = ctypes.WinDLL('kernel32')
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    kernel32.GetCurrentProcess.argtypes = []
+    psapi = ctypes.WinDLL('psapi')
+    psapi.GetProcessMemoryInfo.restype = wintypes.BOOL
+    psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters), wintypes.DWORD]
+else:
+    import resource
+
+# The number of slowest files listed in the summary.
+SLOWEST_FILE_COUNT = 5
+
+
+def peak_memory_usage() -> Optional[int]:
+    '''
+    Get the high-water mark of the memory usage of this process in bytes, or
+    None if the platform doesn't report it.
+    '''
+    if sys.platform == 'win32':
+        # The peak working set is what the maximum resident set size is elsewhere.
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(ProcessMemoryCounters)
+        if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    else:
+        # Linux reports kilobytes, macOS bytes.
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    # Nearest-rank percentile, the values must be sorted and not empty.
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))]
+
+
+class FileTiming(object):
+    def __init__(self, file_name: str, page_count: int, seconds: float, peak_memory: Optional[int]) -> None:
+        self.file_name = file_name
+        self.page_count = page_count
+        self.seconds = seconds
+        self.peak_memory = peak_memory
+
+
+class StageTimings(object):
+    '''
+    The durations of every call of each stage of the pipeline (rasterizing,
+    orientation detection, OCR and so on) and of the files as a whole.
+    '''
+
+    def __init__(self) -> None:
+        self.durations: dict[str, list[float]] = {}
+        self.files: list[FileTiming] = []
+
+    def record(self, stage: str, seconds: float) -> None:
+        # Appending is atomic, so the threads of the page pipeline can record at the same time.
+        self.durations.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, perf_counter() - start_time)
+
+    def record_file(self, file_path: Path, page_count: int, seconds: float) -> None:
+        self.files.append(FileTiming(file_path.name, page_count, seconds, peak_memory_usage()))
+
+    def merge(self, other: StageTimings) -> None:
+        for stage, durations in other.durations.items():
+            self.durations.setdefault(stage, []).extend(durations)
+        self.files.extend(other.files)
+
+    def page_count(self) -> int:
+        return sum(file.page_count for file in self.files)
+
+    def peak_memory(self) -> Optional[int]:
+        # The highest mark of all the processes, each worker keeps its own.
+        peak_memories = [file.peak_memory for file in self.files if file.peak_memory is not None]
+        return max(peak_memories) if len(peak_memories) != 0 else None
+
+    def slowest_files(self) -> list[FileTiming]:
+        return sorted(self.files, key=lambda file: file.seconds, reverse=True)[:SLOWEST_FILE_COUNT]
+
+    def stage_statistics(self) -> dict[str, dict[str, float]]:
+        statistics = {}
+        for stage, durations in sorted(self.durations.items()):
+            sorted_durations = sorted(durations)
+            statistics[stage] = {
+                'count': len(sorted_durations),
+                'total': sum(sorted_durations),
+                'p50': percentile(sorted_durations, 0.5),
+                'p95': percentile(sorted_durations, 0.95),
+            }
+
+        return statistics
+
+    def summary(self, elapsed_seconds: float) -> list[str]:
+        page_count = self.page_count()
+        lines = [f'Processed {page_count} pages of {len(self.files)} files in {elapsed_seconds:.2f}s, '
+                 f'{page_count / elapsed_seconds if elapsed_seconds > 0.0 else 0.0:.2f} pages/s']
+
+        for stage, statistics in self.stage_statistics().items():
+            lines.append(f'Stage {stage}: {statistics["count"]} calls, {statistics["total"]:.2f}s in total, '
+                         f'p50 {statistics["p50"] * 1000.0:.1f}ms, p95 {statistics["p95"] * 1000.0:.1f}ms')
+
+        for file in self.slowest_files():
+            lines.append(f'Slow file {file.file_name}: {file.seconds:.2f}s for {file.page_count} pages')
+
+        peak_memory = self.peak_memory()
+        if peak_memory is not None:
+            lines.append(f'Peak memory usage: {peak_memory / (1024 * 1024):.1f}MB')
+
+        return lines
+
+    def export(self, path: Path, elapsed_seconds: float) -> None:
+        '''
+        Append the report of the run as a single JSON line, so the runs can be
+        compared over time.
+        '''
+        page_count = self.page_count()
+        report = {
+            'time': time(),
+            'seconds': elapsed_seconds,
+            'file_count': len(self.files),
+            'page_count': page_count,
+            'pages_per_second': page_count / elapsed_seconds if elapsed_seconds > 0.0 else 0.0,
+            'peak_memory': self.peak_memory(),
+            'stages': self.stage_statistics(),
+            'files': [
+                {'name': file.file_name, 'page_count': file.page_count, 'seconds': file.seconds,
+                 'peak_memory': file.peak_memory}
+                for file in self.files
+            ],
+        }
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open('a', encoding='utf-8') as report_file:
+            report_file.write(json.dumps(report) + '\n')
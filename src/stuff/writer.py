@@ -0,0 +1,65 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Optional
+from PyPDF2 import PageObject, PdfWriter
+import os
+import uuid
+
+
+class OutputWriter(object):
+    '''
+    Collects the routed pages by the file they're written to, and writes each
+    file once when flushed. Files are written next to their target under a
+    temporary name and then renamed, so a target is never half written.
+    '''
+
+    def __init__(self) -> None:
+        self.pages: dict[Path, PageObject] = {}
+        # The indices of the input pages that end up in each file, including the replaced ones.
+        self.page_indices: dict[Path, list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def add_page(self, file_path: Path, page: PageObject, page_index: Optional[int] = None) -> None:
+        # A later page for the same file replaces the earlier one, just like overwriting the file would.
+        self.pages.pop(file_path, None)
+        self.pages[file_path] = page
+        if page_index is not None:
+            self.page_indices.setdefault(file_path, []).append(page_index)
+
+    def flush(self, written_callback: Optional[Callable[[Path, list[int]], None]] = None) -> list[Path]:
+        '''
+        Write all the collected pages, must be called while the files they
+        were read from are still open. The callback is called right after
+        each file is written, with the indices of its pages. Returns the
+        written file paths.
+        '''
+        written_file_paths = []
+        try:
+            for file_path, page in self.pages.items():
+                self.__write_file(file_path, page)
+                written_file_paths.append(file_path)
+                if written_callback is not None:
+                    written_callback(file_path, self.page_indices.get(file_path, []))
+        finally:
+            self.pages.clear()
+            self.page_indices.clear()
+
+        return written_file_paths
+
+    @staticmethod
+    def __write_file(file_path: Path, page: PageObject) -> None:
+        # Creates a new pdf writer and adds the page.
+        pdf_writer = PdfWriter()
+        pdf_writer.add_page(page)
+
+        # Writes the pdf to a temporary file in the same directory, and moves it in place.
+        temp_file_path = file_path.with_name(f'.{file_path.name}.{uuid.uuid4().hex}.tmp')
+        try:
+            with open(temp_file_path, 'wb') as temp_file:
+                pdf_writer.write(temp_file)
+            os.replace(temp_file_path, file_path)
+        except BaseException:
+            temp_file_path.unlink(missing_ok=True)
+            raise
@@ -0,0 +1,86 @@
+from __future__ import annotations
+from pathlib import Path
+from PyPDF2 import PdfWriter
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTTextContainer
+import random
+import tempfile
+import unittest
+from stuff.layout import iterate_page_layouts
+from stuff.profiles import TITLE_DETECT_CENTER_X, TITLE_DETECT_CENTER_Y, TITLE_DETECT_TOLERNACE
+from stuff.spatial import TextElementIndex
+
+# The number of pages generated, each with its text at other places and in another order.
+PAGE_COUNT = 10
+
+# The number of text objects placed at random on each page, away from the title.
+TEXT_OBJECT_COUNT = 100
+
+
+def write_shuffled_text_pdf(path: Path, seed: int) -> None:
+    # Writes A3 landscape pages with the title at the detection point and text away from it, in a random stream order.
+    rng = random.Random(seed)
+    pdf_writer = PdfWriter()
+    for _ in range(PAGE_COUNT):
+        pdf_writer.add_blank_page(842, 595)
+        pdf_page = pdf_writer.pages[-1]
+
+        font = DictionaryObject({
+            NameObject('/Type'): NameObject('/Font'),
+            NameObject('/Subtype'): NameObject('/Type1'),
+            NameObject('/BaseFont'): NameObject('/Helvetica'),
+        })
+        pdf_page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): pdf_writer._add_object(font)}),
+        })
+
+        # The title has text on both sides on the same baseline, which are only lines of their own as long as the
+        #  text drawn in between them is kept apart.
+        title_x = TITLE_DETECT_CENTER_X - 22.0
+        title_y = TITLE_DETECT_CENTER_Y - 3.0
+        text_objects = [
+            f'BT /F1 8 Tf {title_x - 45.0:.2f} {title_y:.2f} Td (word 16.29) Tj ET',
+            f'BT /F1 8 Tf {title_x:.2f} {title_y:.2f} Td (1003.3.1) Tj ET',
+            f'BT /F1 8 Tf {title_x + 36.0:.2f} {title_y:.2f} Td (9.50) Tj ET',
+        ]
+        for index in range(TEXT_OBJECT_COUNT):
+            text_objects.append(f'BT /F1 {rng.choice((6, 8, 10))} Tf {rng.uniform(0, 500):.2f} '
+                                f'{rng.uniform(0, 580):.2f} Td (word{index} {rng.uniform(0, 100):.2f}) Tj ET')
+        rng.shuffle(text_objects)
+
+        contents = DecodedStreamObject()
+        contents.set_data('\n'.join(text_objects).encode())
+        pdf_page[NameObject('/Contents')] = ArrayObject([pdf_writer._add_object(contents)])
+
+    with path.open('wb') as file:
+        pdf_writer.write(file)
+
+
+def describe(text_elements: list[LTTextContainer]) -> list[tuple[str, tuple[int, int, int, int]]]:
+    return [(e.get_text(), (round(e.x0), round(e.y0), round(e.x1), round(e.y1))) for e in text_elements]
+
+
+class TextElementsNearTest(unittest.TestCase):
+    def test_same_as_whole_page_with_shuffled_stream_order(self) -> None:
+        with tempfile.TemporaryDirectory() as dir_path:
+            path = Path(dir_path) / 'shuffled.pdf'
+            write_shuffled_text_pdf(path, 0)
+
+            page_text_elements = [
+                [e for e in page if isinstance(e, LTTextContainer)] for page in extract_pages(path)
+            ]
+            for page_index, page_layout in enumerate(iterate_page_layouts(path)):
+                near_text_elements = page_layout.text_elements_near(
+                    TITLE_DETECT_CENTER_X, TITLE_DETECT_CENTER_Y, TITLE_DETECT_TOLERNACE)
+
+                with self.subTest(page_index=page_index):
+                    self.assertEqual(
+                        describe(TextElementIndex(near_text_elements).query_radius(
+                            TITLE_DETECT_CENTER_X, TITLE_DETECT_CENTER_Y, TITLE_DETECT_TOLERNACE)),
+                        describe(TextElementIndex(page_text_elements[page_index]).query_radius(
+                            TITLE_DETECT_CENTER_X, TITLE_DETECT_CENTER_Y, TITLE_DETECT_TOLERNACE)))
+
+
+if __name__ == '__main__':
+    unittest.main()